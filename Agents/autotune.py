@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import socket
+import argparse
+
+# Per-host benchmark results, shared by every agent on the machine.
+CACHE_PATH = os.path.expanduser("~/.cache/hiresense/autotune.json")
+BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64, 128]
+# Settings used when tuning is disabled with HIRESENSE_AUTOTUNE=0.
+DEFAULT_SETTINGS = {"threads": None, "batch_size": 32, "token_budget": 32 * 128}
+
+def host_key():
+    return f"{socket.gethostname()}-{os.cpu_count()}cpu"
+
+def current_rss_mb():
+    """Resident set size of this process in MiB (Linux /proc, falling back to peak RSS)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def default_memory_ceiling_mb():
+    """HIRESENSE_MEMORY_CEILING_MB if set, otherwise 75% of physical memory."""
+    if os.environ.get("HIRESENSE_MEMORY_CEILING_MB"):
+        return float(os.environ["HIRESENSE_MEMORY_CEILING_MB"])
+    try:
+        return 0.75 * os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (ValueError, OSError):
+        return float("inf")
+
+def approx_tokens(text):
+    """Cheap token estimate (~4 characters per subword token) used for length bucketing."""
+    return max(1, len(text) // 4)
+
+def thread_candidates():
+    cpus = os.cpu_count() or 1
+    return sorted({max(1, cpus // 4), max(1, cpus // 2), cpus})
+
+class Autotuner:
+    """
+    Picks torch intra-op threads and a batch size for one model on this host by timing it on
+    synthetic inputs, keeping the fastest setting whose RSS stays under the memory ceiling.
+    Results are cached per host and model, so the benchmark runs once per box.
+    """
+    def __init__(self, cache_path=CACHE_PATH, memory_ceiling_mb=None, probe_tokens=128, min_seconds=0.5):
+        self.cache_path = cache_path
+        self.memory_ceiling_mb = memory_ceiling_mb or default_memory_ceiling_mb()
+        self.probe_tokens = probe_tokens
+        self.min_seconds = min_seconds
+
+    def load_cache(self):
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_cache(self, cache):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp_path, self.cache_path)
+
+    def throughput(self, run_batch, batch_size):
+        """Texts per second for one batch size; repeats the batch until min_seconds have passed."""
+        texts = [" ".join(["word"] * self.probe_tokens)] * batch_size
+        run_batch(texts)  # warm-up
+        n, start = 0, time.perf_counter()
+        while time.perf_counter() - start < self.min_seconds:
+            run_batch(texts)
+            n += batch_size
+        return n / (time.perf_counter() - start)
+
+    def tune(self, model_name, run_batch, max_batch_size=BATCH_SIZES[-1]):
+        """
+        Returns {'threads', 'batch_size', 'token_budget'} for the model and applies the thread count.
+        run_batch(list_of_texts) must run the model on one batch.
+        """
+        if os.environ.get("HIRESENSE_AUTOTUNE") == "0":
+            return dict(DEFAULT_SETTINGS)
+
+        import torch
+        key = f"{host_key()}/{model_name}"
+        cache = self.load_cache()
+        if key in cache:
+            settings = cache[key]
+            torch.set_num_threads(settings["threads"])
+            return settings
+
+        print(f"DEBUG: Autotuning {model_name} on {host_key()} (one-off, cached in {self.cache_path})...")
+        with torch.inference_mode():
+            # Threads first, at a mid-sized batch; then grow the batch until throughput stops improving.
+            best_threads, best_rate = None, 0.0
+            for threads in thread_candidates():
+                torch.set_num_threads(threads)
+                rate = self.throughput(run_batch, 8)
+                if rate > best_rate:
+                    best_threads, best_rate = threads, rate
+            torch.set_num_threads(best_threads)
+
+            best_batch, best_rate, stalled = 1, 0.0, 0
+            for batch_size in [b for b in BATCH_SIZES if b <= max_batch_size]:
+                rate = self.throughput(run_batch, batch_size)
+                if current_rss_mb() > self.memory_ceiling_mb:
+                    break
+                if rate > best_rate * 1.05:
+                    best_batch, best_rate, stalled = batch_size, rate, 0
+                else:
+                    stalled += 1
+                    if stalled == 2:
+                        break
+
+        settings = {"threads": best_threads, "batch_size": best_batch,
+                    "token_budget": best_batch * self.probe_tokens, "texts_per_second": round(best_rate, 1)}
+        cache = self.load_cache()
+        cache[key] = settings
+        self.save_cache(cache)
+        print(f"DEBUG: Autotuned {model_name}: {settings}")
+        return settings
+
+class LengthBucketBatcher:
+    """
+    Groups texts of similar length and sizes each batch to a token budget, so batches of short
+    texts get larger and batches of long texts smaller. If RSS crosses the memory ceiling during
+    a run, the budget is halved for the remaining batches.
+    """
+    def __init__(self, token_budget, max_batch_size=BATCH_SIZES[-1], max_length=512, bucket_width=32,
+                 memory_ceiling_mb=None):
+        self.token_budget = token_budget
+        self.max_batch_size = max_batch_size
+        self.max_length = max_length
+        self.bucket_width = bucket_width
+        self.memory_ceiling_mb = memory_ceiling_mb or default_memory_ceiling_mb()
+
+    @classmethod
+    def from_settings(cls, settings, **kwargs):
+        return cls(settings["token_budget"], max_batch_size=max(settings["batch_size"] * 4, 1), **kwargs)
+
+    def batches(self, texts):
+        """Yields lists of indices into texts, grouped by length bucket."""
+        lengths = [min(approx_tokens(t), self.max_length) for t in texts]
+        order = sorted(range(len(texts)), key=lambda i: lengths[i])
+        batch = []
+        for i in order:
+            # Texts arrive shortest first, so the newest text sets the padded length of the batch.
+            bucket_length = -(-lengths[i] // self.bucket_width) * self.bucket_width
+            batch_size = max(1, min(self.max_batch_size, self.token_budget // bucket_length))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+            batch.append(i)
+        if batch:
+            yield batch
+
+    def run(self, fn, texts, on_batch=None):
+        """
+        Applies fn (list of texts -> list of outputs) batch by batch and returns the outputs in
+        input order. on_batch(indices, outputs) is called after each batch.
+        """
+        results = [None] * len(texts)
+        for indices in self.batches(texts):
+            outputs = fn([texts[i] for i in indices])
+            for i, out in zip(indices, outputs):
+                results[i] = out
+            if on_batch is not None:
+                on_batch(indices, outputs)
+            if current_rss_mb() > self.memory_ceiling_mb and self.token_budget > self.bucket_width:
+                self.token_budget //= 2
+                print(f"DEBUG: RSS above {self.memory_ceiling_mb:.0f} MiB; token budget lowered to {self.token_budget}.")
+        return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inference Autotuner cache")
+    parser.add_argument("--cache_path", type=str, default=CACHE_PATH,
+                        help=f"Autotune cache file (default: {CACHE_PATH})")
+    parser.add_argument("--clear", action="store_true",
+                        help="Forget this host's tuned settings so the next run re-benchmarks")
+    args = parser.parse_args()
+
+    tuner = Autotuner(cache_path=args.cache_path)
+    cache = tuner.load_cache()
+    if args.clear:
+        cache = {k: v for k, v in cache.items() if not k.startswith(host_key() + "/")}
+        tuner.save_cache(cache)
+        print(f"Cleared autotune settings for {host_key()}.")
+    else:
+        for key, settings in cache.items():
+            print(f"{key}: {settings}")
@@ -3,81 +3,183 @@ import argparse
 import pandas as pd
 import spacy
 import re
+from results_store import ResultsStore
+from candidate_store import load_store
+from feedback_agent import bias_free_score
 
 # In production, you might expand this lexicon or use models for bias detection.
 BIASED_TERMS = {"ninja", "rockstar", "guru", "aggressive", "whiz", "bombastic", "alpha", "dominant"}
 
 def detect_bias(text):
     """Detect biased terms in the text (case-insensitive)."""
-    words = re.findall(r'\w+', text.lower())
+    words = set(re.findall(r'\w+', text.lower()))
     flagged = [term for term in BIASED_TERMS if term in words]
     return flagged
 
+# Structured PII is caught by compiled regexes before any NER runs. spaCy alone misses
+# emails and labels phone numbers such as "+1-308-8942" as NORP.
+PII_PATTERNS = [
+    ("EMAIL", re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")),
+    ("URL", re.compile(r"(?:https?://|www\.)[^\s<>\"']+|\b(?:linkedin|github)\.com/[^\s<>\"']+", re.IGNORECASE)),
+    ("PHONE", re.compile(
+        r"(?<![\w+])(?:\+\d{1,3}[\s.-]?\(?\d{1,4}\)?(?:[\s.-]?\d{2,4}){1,3}"
+        r"|\(\d{2,4}\)\s?\d{3,4}[\s.-]?\d{3,4}"
+        r"|\d{3}[\s.-]\d{3}[\s.-]\d{4})(?!\w)"
+    )),
+]
+
+# A PERSON entity needs at least one capitalised word; texts without one skip NER entirely.
+CAPITALISED_WORD = re.compile(r"\b[A-Z][a-z]")
+
+REDACTION_TOKEN = "[REDACTED]"
+
+class PIIRedactor:
+    """
+    Redacts emails, phone numbers and URLs with regexes, and PERSON names with spaCy NER.
+    NER runs in nlp.pipe batches with every other pipeline component disabled, and only
+    on texts that could contain a name. Each output string is built in one linear pass
+    and comes with an offset map of what was redacted.
+    """
+    def __init__(self, nlp, batch_size=64, n_process=1, token=REDACTION_TOKEN):
+        self.nlp = nlp
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.token = token
+        # en_core_web_sm's NER carries its own tok2vec, so it can run on its own.
+        self.ner_disabled = [name for name in nlp.pipe_names if name != "ner"]
+
+    def regex_spans(self, text):
+        spans = []
+        for label, pattern in PII_PATTERNS:
+            spans.extend((m.start(), m.end(), label) for m in pattern.finditer(text))
+        return spans
+
+    def person_spans(self, texts):
+        """Yields PERSON spans per text, running NER only on texts that may contain a name."""
+        needs_ner = [i for i, text in enumerate(texts) if CAPITALISED_WORD.search(text)]
+        spans = [[] for _ in texts]
+        docs = self.nlp.pipe((texts[i] for i in needs_ner), batch_size=self.batch_size,
+                             n_process=self.n_process, disable=self.ner_disabled)
+        for i, doc in zip(needs_ner, docs):
+            spans[i] = [(ent.start_char, ent.end_char, "PERSON") for ent in doc.ents if ent.label_ == "PERSON"]
+        return spans
+
+    def apply(self, text, spans):
+        """
+        Builds the redacted text in one left-to-right pass. Overlapping spans are merged,
+        and the span that starts first keeps its label. Returns the text and an offset map
+        of {label, start, end, redacted_start, redacted_end} entries, where start/end index
+        the original text and redacted_start/redacted_end index the output.
+        """
+        parts = []
+        offset_map = []
+        cursor = 0
+        out_len = 0
+        for start, end, label in sorted(spans):
+            if start < cursor:
+                if end > cursor:
+                    offset_map[-1]["end"] = end
+                    cursor = end
+                continue
+            parts.append(text[cursor:start])
+            out_len += start - cursor
+            parts.append(self.token)
+            offset_map.append({
+                "label": label, "start": start, "end": end,
+                "redacted_start": out_len, "redacted_end": out_len + len(self.token)
+            })
+            out_len += len(self.token)
+            cursor = end
+        parts.append(text[cursor:])
+        return "".join(parts), offset_map
+
+    def redact_batch(self, texts):
+        """Redacts a list of texts. Returns a list of (redacted_text, offset_map) tuples."""
+        texts = [text if isinstance(text, str) else "" for text in texts]
+        # Duplicate submissions repeat the same text; redact each distinct text once.
+        unique_texts = list(dict.fromkeys(texts))
+        person_spans = self.person_spans(unique_texts)
+        redacted = {text: self.apply(text, self.regex_spans(text) + persons)
+                    for text, persons in zip(unique_texts, person_spans)}
+        return [redacted[text] for text in texts]
+
+    def redact(self, text):
+        return self.redact_batch([text])[0]
+
 def anonymize_text(text, nlp):
-    """Anonymize text by replacing any PERSON entity with [REDACTED]."""
-    doc = nlp(text)
-    anonymized = text
-    # Replace entities from the end of text to avoid index shifts.
-    for ent in sorted(doc.ents, key=lambda x: x.start_char, reverse=True):
-        if ent.label_ == "PERSON":
-            anonymized = anonymized[:ent.start_char] + "[REDACTED]" + anonymized[ent.end_char:]
-    return anonymized
+    """Anonymize text by replacing PERSON entities, emails, phone numbers and URLs with [REDACTED]."""
+    return PIIRedactor(nlp).redact(text)[0]
 
 class BiasFairnessMonitorAgent:
-    def __init__(self):
-        try:
-            self.nlp = spacy.load("en_core_web_sm")
-        except Exception as e:
-            print("Error loading spaCy model. Run: python -m spacy download en_core_web_sm")
-            exit(1)
+    def __init__(self, nlp=None):
+        # An already-loaded pipeline can be passed in so processes that hold several agents share one copy.
+        if nlp is not None:
+            self.nlp = nlp
+        else:
+            try:
+                self.nlp = spacy.load("en_core_web_sm")
+            except Exception as e:
+                print("Error loading spaCy model. Run: python -m spacy download en_core_web_sm")
+                exit(1)
+        self.redactor = PIIRedactor(self.nlp)
 
     def process_jd(self, input_csv, output_csv):
         df = pd.read_csv(input_csv, encoding="utf-8")
         if "optimized_jd" not in df.columns:
             print("Error: Input JD CSV must contain 'optimized_jd' column.")
             exit(1)
-        jd_bias_flags = []
-        jd_anonymized = []
-        for text in df["optimized_jd"]:
-            flags = detect_bias(text)
-            jd_bias_flags.append(flags)
-            jd_anonymized.append(anonymize_text(text, self.nlp))
-        df["jd_bias_flags"] = jd_bias_flags
-        df["jd_anonymized"] = jd_anonymized
+        redacted = self.redactor.redact_batch(df["optimized_jd"].tolist())
+        df["jd_bias_flags"] = [detect_bias(text) for text in df["optimized_jd"]]
+        df["jd_anonymized"] = [text for text, _ in redacted]
         # Retain key columns for production reporting.
         keep = ["Job Title", "Job Description", "optimized_jd", "grade_level", "extracted_entities", "jd_bias_flags", "jd_anonymized"]
         df = df[keep]
         df.to_csv(output_csv, index=False, encoding="utf-8")
         print(f"JD bias & fairness output saved to {output_csv}")
 
-    def process_cv(self, input_csv, output_csv):
-        df = pd.read_csv(input_csv, encoding="utf-8")
-        if "cv_text_preview" not in df.columns:
-            print("Error: Input CV CSV must contain 'cv_text_preview' column.")
-            exit(1)
-        cv_bias_flags = []
-        cv_anonymized = []
-        for text in df["cv_text_preview"]:
-            flags = detect_bias(text)
-            cv_bias_flags.append(flags)
-            cv_anonymized.append(anonymize_text(text, self.nlp))
-        df["cv_bias_flags"] = cv_bias_flags
-        df["cv_anonymized"] = cv_anonymized
-        df.to_csv(output_csv, index=False, encoding="utf-8")
+    def process_cv(self, store_path, output_csv, results_db="memory.db"):
+        """
+        Flags biased wording and anonymizes each CV preview in the candidate store, saves the
+        results back to it and writes a report CSV.
+        """
+        candidates = load_store(store_path)
+        ids = candidates.candidate_ids
+        previews = [text or "" for text in candidates.text_column("cv_text_preview")]
+        redacted = self.redactor.redact_batch(previews)
+        flagged = [detect_bias(text) for text in previews]
+        flags = [str(terms) for terms in flagged]
+        scores = [bias_free_score(terms) for terms in flagged]
+        candidates.set_texts("cv_bias_flags", dict(zip(ids, flags)))
+        candidates.set_texts("cv_anonymized", {cid: text for cid, (text, _) in zip(ids, redacted)})
+        candidates.set_scores("bias_free_score", dict(zip(ids, scores)))
+        candidates.save(store_path)
+        store = ResultsStore(results_db)
+        store.upsert_many({"candidate_id": cid, "cv_bias_flags": f, "bias_free_score": score}
+                          for cid, f, score in zip(ids, flags, scores))
+        store.close()
+        pd.DataFrame({
+            "candidate_filename": ids,
+            "cv_bias_flags": flags,
+            "bias_free_score": scores,
+            "cv_anonymized": [text for text, _ in redacted],
+            "cv_redaction_map": [offset_map for _, offset_map in redacted],
+        }).to_csv(output_csv, index=False, encoding="utf-8")
         print(f"CV bias & fairness output saved to {output_csv}")
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Bias & Fairness Monitor Agent")
     parser.add_argument("--jd_input", type=str, default="/Users/sridhrutitikkisetti/Desktop/Accenture/agents/optimized_jds.csv",
                         help="Input JD CSV (default: optimized_jds.csv)")
-    parser.add_argument("--cv_input", type=str, default="/Users/sridhrutitikkisetti/Desktop/Accenture/agents/cv_grading_results.csv",
-                        help="Input CV CSV (default: cv_grading_results.csv)")
+    parser.add_argument("--store_path", type=str, default="candidate_store.npz",
+                        help="Candidate store from the CV grader, updated in place (default: candidate_store.npz)")
     parser.add_argument("--jd_output", type=str, default="jd_bias_fairness.csv",
                         help="Output JD CSV with bias info (default: jd_bias_fairness.csv)")
     parser.add_argument("--cv_output", type=str, default="cv_bias_fairness.csv",
                         help="Output CV CSV with bias info (default: cv_bias_fairness.csv)")
+    parser.add_argument("--results_db", type=str, default="memory.db",
+                        help="SQLite DB holding the live results read by the dashboard (default: memory.db)")
     args = parser.parse_args()
     
     agent = BiasFairnessMonitorAgent()
     agent.process_jd(args.jd_input, args.jd_output)
-    agent.process_cv(args.cv_input, args.cv_output)
+    agent.process_cv(args.store_path, args.cv_output, args.results_db)
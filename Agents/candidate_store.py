@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+import os
+import json
+import argparse
+import numpy as np
+
+# Per-candidate scores, each held in one contiguous float32 array (NaN = not computed yet).
+SCORE_FIELDS = [
+    "grade_score", "embedding_score", "keyword_score", "persona_fit_score", "bias_free_score",
+    "composite_score", "feedback_adjustment", "updated_score"
+]
+# Per-candidate strings, each held as an int32 array of ids into the text arena (-1 = missing).
+TEXT_FIELDS = [
+    "cv_text_preview", "dedup_status", "duplicate_of", "dedup_cluster",
+    "cv_bias_flags", "cv_anonymized", "explanation"
+]
+
+def grow(array, min_size):
+    """Returns the array with capacity for at least min_size items, doubling to amortise growth."""
+    if len(array) >= min_size:
+        return array
+    grown = np.empty(max(min_size, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+def pack_strings(strings):
+    """Encodes a list of strings as (offsets, UTF-8 bytes), the layout used for the text arena."""
+    data = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(data) + 1, dtype=np.int64)
+    np.cumsum([len(d) for d in data], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(data), dtype=np.uint8)
+
+def unpack_strings(offsets, arena):
+    raw = arena.tobytes()
+    return [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+class CandidateRow:
+    """Lightweight view of one candidate; holds no data of its own."""
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def candidate_id(self):
+        return self.store.candidate_ids[self.index]
+
+    @property
+    def entities(self):
+        return self.store.entities(self.index)
+
+    def __getattr__(self, name):
+        if name in SCORE_FIELDS:
+            return float(self.store.scores[name][self.index])
+        if name in TEXT_FIELDS:
+            return self.store.get_text(self.index, name)
+        raise AttributeError(name)
+
+    def __repr__(self):
+        return f"CandidateRow({self.candidate_id!r})"
+
+class CandidateStore:
+    """
+    Compact candidate table, and the format the CV stages hand to each other. Scores live in
+    contiguous float32 arrays; entity labels are interned into uint8 codes; all strings live in
+    one UTF-8 arena addressed by an offset array. Entity texts are interned there and referenced
+    by int32 ids, and each text field (previews, bias flags, explanations) is an int32 id column.
+    Entities are grouped per candidate CSR-style through entity_ptr, so a candidate's entities
+    are a contiguous slice. Candidates and their entities are appended once; scores and text
+    fields can be set afterwards.
+    """
+    def __init__(self, capacity=1024):
+        self.n = 0
+        self.candidate_ids = []
+        self.row_of = {}
+        self.scores = {field: np.full(capacity, np.nan, dtype=np.float32) for field in SCORE_FIELDS}
+        self.text_fields = {field: np.full(capacity, -1, dtype=np.int32) for field in TEXT_FIELDS}
+        self.entity_ptr = np.zeros(capacity + 1, dtype=np.int64)
+        self.n_entities = 0
+        self.entity_text_ids = np.empty(capacity * 8, dtype=np.int32)
+        self.entity_labels = np.empty(capacity * 8, dtype=np.uint8)
+        self.labels = []
+        self.label_codes = {}
+        self.arena = np.empty(capacity * 256, dtype=np.uint8)
+        self.text_offsets = np.zeros(capacity * 8 + 1, dtype=np.int64)
+        self.n_texts = 0
+        # Only entity texts are interned; long per-candidate texts are appended as they come.
+        self.text_ids = {}
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        return (CandidateRow(self, i) for i in range(self.n))
+
+    def __getitem__(self, candidate_id):
+        return CandidateRow(self, self.row_of[candidate_id])
+
+    def intern_label(self, label):
+        code = self.label_codes.get(label)
+        if code is None:
+            if len(self.labels) == 256:
+                raise ValueError("More than 256 distinct entity labels.")
+            code = self.label_codes[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+    def append_text(self, text):
+        """Copies a string into the arena and returns its text id."""
+        data = text.encode("utf-8")
+        start = self.text_offsets[self.n_texts]
+        self.arena = grow(self.arena, start + len(data))
+        self.arena[start:start + len(data)] = np.frombuffer(data, dtype=np.uint8)
+        self.text_offsets = grow(self.text_offsets, self.n_texts + 2)
+        self.text_offsets[self.n_texts + 1] = start + len(data)
+        self.n_texts += 1
+        return self.n_texts - 1
+
+    def intern_text(self, text):
+        text_id = self.text_ids.get(text)
+        if text_id is None:
+            text_id = self.text_ids[text] = self.append_text(text)
+        return text_id
+
+    def text(self, text_id):
+        return self.arena[self.text_offsets[text_id]:self.text_offsets[text_id + 1]].tobytes().decode("utf-8")
+
+    def decode_texts(self, text_ids):
+        """Decodes an array of text ids into a list of strings (None for -1), reading the arena in place."""
+        text_ids = np.asarray(text_ids)
+        valid = text_ids.clip(min=0)
+        arena = memoryview(self.arena)
+        return [None if t < 0 else str(arena[start:end], "utf-8") for t, start, end in
+                zip(text_ids.tolist(), self.text_offsets[valid].tolist(), self.text_offsets[valid + 1].tolist())]
+
+    def add(self, candidate_id, entities=(), **values):
+        """
+        Appends a candidate with its entities ({'text', 'label'} dicts or (text, label) pairs)
+        and any of SCORE_FIELDS and TEXT_FIELDS. Returns the row index.
+        """
+        if candidate_id in self.row_of:
+            raise ValueError(f"Candidate '{candidate_id}' is already in the store; use set_score to update it.")
+        unknown = set(values) - set(SCORE_FIELDS) - set(TEXT_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown candidate fields: {sorted(unknown)}")
+        i = self.n
+        for field in SCORE_FIELDS:
+            self.scores[field] = grow(self.scores[field], i + 1)
+            value = values.get(field)
+            self.scores[field][i] = np.nan if value is None else value
+        for field in TEXT_FIELDS:
+            self.text_fields[field] = grow(self.text_fields[field], i + 1)
+            value = values.get(field)
+            self.text_fields[field][i] = -1 if value is None else self.append_text(str(value))
+        self.entity_ptr = grow(self.entity_ptr, i + 2)
+
+        entities = [(e["text"], e["label"]) if isinstance(e, dict) else e for e in entities]
+        start = self.n_entities
+        self.entity_text_ids = grow(self.entity_text_ids, start + len(entities))
+        self.entity_labels = grow(self.entity_labels, start + len(entities))
+        for j, (text, label) in enumerate(entities, start):
+            self.entity_text_ids[j] = self.intern_text(text)
+            self.entity_labels[j] = self.intern_label(label)
+        self.n_entities = start + len(entities)
+        self.entity_ptr[i + 1] = self.n_entities
+
+        self.candidate_ids.append(candidate_id)
+        self.row_of[candidate_id] = i
+        self.n += 1
+        return i
+
+    def set_score(self, candidate_id, field, value):
+        self.scores[field][self.row_of[candidate_id]] = value
+
+    def set_scores(self, field, values_by_id):
+        """Updates one score column for many candidates; ids not in the store are ignored."""
+        column = self.scores[field]
+        for candidate_id, value in values_by_id.items():
+            i = self.row_of.get(candidate_id)
+            if i is not None:
+                column[i] = np.nan if value is None else value
+
+    def score_column(self, field):
+        """Zero-copy view of one score column, in row order."""
+        return self.scores[field][:self.n]
+
+    def get_text(self, index, field):
+        text_id = self.text_fields[field][index]
+        return None if text_id < 0 else self.text(text_id)
+
+    def set_text(self, candidate_id, field, value):
+        self.set_texts(field, {candidate_id: value})
+
+    def set_texts(self, field, values_by_id):
+        """Updates one text column for many candidates; ids not in the store are ignored."""
+        column = self.text_fields[field]
+        for candidate_id, value in values_by_id.items():
+            i = self.row_of.get(candidate_id)
+            if i is not None:
+                column[i] = -1 if value is None else self.append_text(str(value))
+
+    def text_column(self, field):
+        """One text column as a list in row order (None where unset)."""
+        return self.decode_texts(self.text_fields[field][:self.n])
+
+    def entities(self, index):
+        lo, hi = self.entity_ptr[index], self.entity_ptr[index + 1]
+        return [{"text": self.text(t), "label": self.labels[l]}
+                for t, l in zip(self.entity_text_ids[lo:hi], self.entity_labels[lo:hi])]
+
+    def entities_json(self, rows=None):
+        """
+        Each candidate's entities as a JSON list string, the form reports and the Candidates
+        table use, built straight from the entity columns: every distinct (text, label) pair is
+        serialised once and the pieces are joined per candidate. rows picks candidates by row
+        index (default: all).
+        """
+        keys = self.entity_text_ids[:self.n_entities].astype(np.int64) * 256 + self.entity_labels[:self.n_entities]
+        unique, inverse = np.unique(keys, return_inverse=True)
+        fragments = np.array([json.dumps({"text": text, "label": self.labels[code]})
+                              for text, code in zip(self.decode_texts(unique // 256), (unique % 256).tolist())],
+                             dtype=object)
+        per_entity = fragments[inverse.ravel()].tolist()
+        ptr = self.entity_ptr[:self.n + 1].tolist()
+        rows = range(self.n) if rows is None else rows
+        return ["[" + ", ".join(per_entity[ptr[i]:ptr[i + 1]]) + "]" for i in rows]
+
+    def subset(self, candidate_ids, entities_by_id=None):
+        """
+        Copies the given candidates, in that order, into a new store. Entities for a candidate
+        can be replaced through entities_by_id, e.g. once they are extracted for a shortlist.
+        """
+        entities_by_id = entities_by_id or {}
+        subset = CandidateStore(capacity=max(len(candidate_ids), 1))
+        for candidate_id in candidate_ids:
+            i = self.row_of[candidate_id]
+            values = {field: self.scores[field][i] for field in SCORE_FIELDS}
+            values.update({field: self.get_text(i, field) for field in TEXT_FIELDS})
+            subset.add(candidate_id, entities_by_id.get(candidate_id, self.entities(i)), **values)
+        return subset
+
+    def to_numpy(self):
+        """Zero-copy views of the live columns, trimmed to the filled length."""
+        columns = {field: self.scores[field][:self.n] for field in SCORE_FIELDS}
+        columns.update({field: self.text_fields[field][:self.n] for field in TEXT_FIELDS})
+        columns.update({
+            "entity_ptr": self.entity_ptr[:self.n + 1],
+            "entity_text_ids": self.entity_text_ids[:self.n_entities],
+            "entity_labels": self.entity_labels[:self.n_entities],
+            "text_offsets": self.text_offsets[:self.n_texts + 1],
+            "arena": self.arena[:self.text_offsets[self.n_texts]],
+        })
+        return columns
+
+    def to_arrow(self):
+        """
+        Exports (candidates, entities) as two pyarrow Tables. Score columns, entity offsets,
+        label codes and the text arena are wrapped without copying; entity text and labels are
+        dictionary-encoded over the interned values. Requires the optional pyarrow package.
+        """
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("CandidateStore.to_arrow requires pyarrow. Install it with: pip install pyarrow")
+        cols = self.to_numpy()
+        texts = pa.LargeStringArray.from_buffers(
+            self.n_texts, pa.py_buffer(cols["text_offsets"]), pa.py_buffer(cols["arena"])
+        )
+        candidates = pa.table(dict(
+            {"candidate_id": pa.array(self.candidate_ids, type=pa.string()),
+             "entity_start": pa.array(cols["entity_ptr"][:-1]),
+             "entity_end": pa.array(cols["entity_ptr"][1:])},
+            **{field: pa.array(cols[field]) for field in SCORE_FIELDS},
+            **{field: pa.DictionaryArray.from_arrays(pa.array(cols[field], mask=cols[field] < 0), texts)
+               for field in TEXT_FIELDS}
+        ))
+        entities = pa.table({
+            "text": pa.DictionaryArray.from_arrays(pa.array(cols["entity_text_ids"]), texts),
+            "label": pa.DictionaryArray.from_arrays(pa.array(cols["entity_labels"]), pa.array(self.labels, type=pa.string())),
+        })
+        return candidates, entities
+
+    def save(self, path):
+        """
+        Writes the store to an .npz file that any agent can load. Candidate ids and labels are
+        packed like the text arena, so the file holds only numeric arrays and loads without pickle.
+        """
+        id_offsets, id_arena = pack_strings(self.candidate_ids)
+        label_offsets, label_arena = pack_strings(self.labels)
+        np.savez(path, id_offsets=id_offsets, id_arena=id_arena,
+                 label_offsets=label_offsets, label_arena=label_arena, **self.to_numpy())
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path, allow_pickle=False)
+        store = cls(capacity=1)
+        store.candidate_ids = unpack_strings(data["id_offsets"], data["id_arena"])
+        store.n = len(store.candidate_ids)
+        store.row_of = {cid: i for i, cid in enumerate(store.candidate_ids)}
+        # Columns missing from files written by older versions start out unset.
+        store.scores = {field: data[field].copy() if field in data.files else np.full(store.n, np.nan, dtype=np.float32)
+                        for field in SCORE_FIELDS}
+        store.text_fields = {field: data[field].copy() if field in data.files else np.full(store.n, -1, dtype=np.int32)
+                             for field in TEXT_FIELDS}
+        store.entity_ptr = data["entity_ptr"].copy()
+        store.entity_text_ids = data["entity_text_ids"].copy()
+        store.entity_labels = data["entity_labels"].copy()
+        store.n_entities = len(store.entity_labels)
+        store.labels = unpack_strings(data["label_offsets"], data["label_arena"])
+        store.label_codes = {label: code for code, label in enumerate(store.labels)}
+        store.text_offsets = data["text_offsets"].copy()
+        store.arena = data["arena"].copy()
+        store.n_texts = len(store.text_offsets) - 1
+        store.text_ids = {store.text(i): i for i in np.unique(store.entity_text_ids).tolist()}
+        return store
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """
+        Builds a store from a DataFrame with 'candidate_filename', any of SCORE_FIELDS and
+        TEXT_FIELDS, and 'extracted_entities' as lists or JSON strings.
+        """
+        store = cls(capacity=max(len(df), 1))
+        fields = [f for f in SCORE_FIELDS + TEXT_FIELDS if f in df.columns]
+        for row in df.itertuples(index=False):
+            row = row._asdict()
+            entities = row.get("extracted_entities", [])
+            if isinstance(entities, str):
+                entities = json.loads(entities)
+            elif not isinstance(entities, list):
+                entities = []
+            values = {f: row[f] for f in fields}
+            for f in TEXT_FIELDS:
+                # Empty CSV or SQL cells arrive as NaN or None.
+                if f in values and not isinstance(values[f], str):
+                    values[f] = None
+            store.add(row["candidate_filename"], entities, **values)
+        return store
+
+    def to_dataframe(self, fields=None, entities=False):
+        """
+        Materialises the given fields (default: all) as a DataFrame keyed by 'candidate_filename',
+        for reports and aggregation. With entities=True, 'extracted_entities' holds the lists.
+        """
+        import pandas as pd
+        fields = fields if fields is not None else SCORE_FIELDS + TEXT_FIELDS
+        df = pd.DataFrame({"candidate_filename": self.candidate_ids})
+        for field in fields:
+            df[field] = self.scores[field][:self.n] if field in SCORE_FIELDS else self.text_column(field)
+        if entities:
+            df["extracted_entities"] = [self.entities(i) for i in range(self.n)]
+        return df
+
+def load_store(path):
+    """Loads the store a CV stage reads from, exiting with a clear message if the grader has not written it."""
+    if not os.path.exists(path):
+        print(f"Error: candidate store '{path}' not found. Run cv_grader.py first.")
+        exit(1)
+    return CandidateStore.load(path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact Candidate Store")
+    parser.add_argument("--store_path", type=str, default="candidate_store.npz",
+                        help="Path to a saved candidate store (default: candidate_store.npz)")
+    args = parser.parse_args()
+
+    store = load_store(args.store_path)
+    cols = store.to_numpy()
+    size = sum(a.nbytes for a in cols.values())
+    print(f"{len(store)} candidates, {store.n_entities} entities, {store.n_texts} arena strings, "
+          f"{len(store.labels)} labels; {size / 1024:.1f} KiB of column data")
@@ -3,15 +3,31 @@
 import os
 import sys
 import argparse
+import hashlib
 import pandas as pd
 import spacy
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 from PyPDF2 import PdfReader
+from keyword_index import BM25Index, jd_query_terms, fuse_scores
+from results_store import ResultsStore
+from dedup import DedupIndex
+from candidate_store import CandidateStore
+from autotune import Autotuner, LengthBucketBatcher
+
+# Column order of the cv_grading_results.csv report; entities stay in the candidate store.
+CV_RESULT_COLUMNS = [
+    "candidate_filename", "grade_score", "embedding_score", "keyword_score",
+    "cv_text_preview", "dedup_status", "duplicate_of", "dedup_cluster"
+]
+# CVs read, embedded, published and then NER'd together. Bounds how much full CV text is held
+# at once, and how many CVs are read before the first grades reach the live results.
+GRADE_CHUNK_SIZE = 64
 
 class CVParserGrader:
-    def __init__(self):
+    def __init__(self, index_db="cv_index.db", embedding_weight=0.7, keyword_weight=0.3, results_db="memory.db",
+                 dedup_db="memory.db", store_path="candidate_store.npz", prescreen=False):
         # Load spaCy model for entity extraction.
         try:
             self.nlp = spacy.load("en_core_web_sm")
@@ -27,6 +43,22 @@ class CVParserGrader:
             print("Error loading SentenceTransformer model. Please install 'sentence-transformers' package.")
             sys.exit(1)
 
+        # Batch size, token budget and torch threads tuned for this host (benchmarked once, then cached).
+        settings = Autotuner().tune(
+            "all-MiniLM-L6-v2", lambda texts: self.embedder.encode(texts, batch_size=len(texts))
+        )
+        self.batcher = LengthBucketBatcher.from_settings(settings, max_length=self.embedder.max_seq_length)
+
+        # Hybrid scoring: the semantic score is fused with BM25 over the persistent keyword index.
+        self.index_db = index_db
+        self.embedding_weight = embedding_weight
+        self.keyword_weight = keyword_weight
+        self.results_db = results_db
+        self.dedup_db = dedup_db
+        self.store_path = store_path
+        # Cascade stage 1: skip NER while scoring the pool; entities are extracted for the shortlist only.
+        self.prescreen = prescreen
+
     def extract_text_from_pdf(self, file_path):
         """
         Extracts text from a PDF file using PyPDF2.
@@ -52,6 +84,10 @@ class CVParserGrader:
         entities = [{"text": ent.text, "label": ent.label_} for ent in doc.ents]
         return entities
 
+    def extract_cv_entities_batch(self, cv_texts):
+        """Batched version of extract_cv_entities: runs the CVs through nlp.pipe in input order."""
+        return [[{"text": ent.text, "label": ent.label_} for ent in doc.ents] for doc in self.nlp.pipe(cv_texts)]
+
     def grade_candidate(self, cv_text, jd_embedding):
         """
         Grades a candidate by computing the semantic similarity between:
@@ -63,11 +99,178 @@ class CVParserGrader:
         similarity_score = cosine_similarity(cv_embedding, jd_embedding.reshape(1, -1))[0][0]
         return similarity_score
 
-    def process_cv_folder(self, jd_csv_path, cv_folder, output_csv_path):
+    def grade_candidates(self, cv_texts, jd_embedding, on_batch=None):
         """
-        Reads 'optimized_jd' from the first row of the JD CSV (the output from the JD agent)
-        and uses it as the reference text for scoring CVs in the specified folder.
-        Supports PDF and TXT files.
+        Batched version of grade_candidate: embeds the CVs in length-bucketed batches sized by
+        the autotuner and returns their cosine similarity scores in input order.
+        on_batch(indices, scores) is called as each batch finishes.
+        """
+        def score_batch(texts):
+            embeddings = self.embedder.encode(texts, batch_size=len(texts))
+            return cosine_similarity(embeddings, jd_embedding.reshape(1, -1))[:, 0]
+        return self.batcher.run(score_batch, cv_texts, on_batch=on_batch)
+
+    def read_cv_text(self, file_path):
+        """
+        Reads a CV in PDF or TXT format. Returns None for unsupported or unreadable files.
+        """
+        if file_path.lower().endswith(".pdf"):
+            print(f"DEBUG: Processing PDF file '{file_path}'.")
+            return self.extract_text_from_pdf(file_path)
+        if file_path.lower().endswith(".txt"):
+            print(f"DEBUG: Processing TXT file '{file_path}'.")
+            try:
+                with open(file_path, "r", encoding="utf-8") as f:
+                    return f.read()
+            except Exception as e:
+                print(f"Error reading TXT file '{file_path}': {e}")
+                return None
+        print(f"DEBUG: Skipping file '{file_path}' (unsupported file type).")
+        return None
+
+    def grade_files(self, file_paths, reference_jd, jd_entities=None, store=None, score_keywords=True):
+        """
+        Grades the given CV files against one JD and returns a CandidateStore holding each CV's
+        'embedding_score', 'keyword_score', entities, text preview and dedup status. The two
+        scores are not fused here, because the BM25 score is normalised over the whole candidate
+        pool, which may span several calls. Files are handled GRADE_CHUNK_SIZE at a time, so only
+        one chunk's full text is held in memory: each chunk is read and embedded, then its
+        entities are extracted in nlp.pipe batches, then it is indexed.
+        If a ResultsStore is given, embedding scores are published as each batch is computed,
+        before the chunk goes through NER.
+        With score_keywords=False the CVs are only indexed and 'keyword_score' is left unset, for
+        callers that grade part of a pool and BM25-score the whole pool once afterwards.
+        """
+        jd_embedding = self.embedder.encode([reference_jd])
+        jd_hash = hashlib.sha1(reference_jd.encode("utf-8")).hexdigest()
+        print("DEBUG: Successfully computed JD embedding from optimized_jd.")
+
+        candidates = CandidateStore(capacity=max(len(file_paths), 1))
+        dedup = DedupIndex(self.dedup_db)
+        dedup_counts = {"new": 0, "exact": 0, "near": 0}
+        index = BM25Index(self.index_db)
+        changed = 0
+        # Row of the first CV with each content, so same-content copies in this run share its results.
+        row_of_hash = {}
+
+        for start in range(0, len(file_paths), GRADE_CHUNK_SIZE):
+            cv_texts = {}
+            # (filename, dedup info, cached result) per readable CV, in file order.
+            chunk = []
+            for file_path in file_paths[start:start + GRADE_CHUNK_SIZE]:
+                filename = os.path.basename(file_path)
+                cv_text = self.read_cv_text(file_path)
+                if cv_text is None:
+                    continue
+                if not cv_text.strip():
+                    print(f"WARNING: No text extracted from '{file_path}'. Skipping.")
+                    continue
+
+                # Resubmissions of content already graded against this JD reuse the earlier results.
+                dedup_info = dedup.check(filename, cv_text)
+                dedup_counts[dedup_info["status"]] += 1
+                cached = dedup.cached_result(dedup_info["content_hash"], jd_hash)
+                if cached is not None:
+                    print(f"DEBUG: '{filename}' duplicates '{dedup_info['duplicate_of'] or filename}'; reusing results.")
+                    if store is not None:
+                        store.upsert(filename, grade_score=cached[0])
+                chunk.append((filename, dedup_info, cached))
+                cv_texts[filename] = cv_text
+
+            # CVs whose content is new to this run need an embedding (and entities); same-content
+            # copies share the results of the first one.
+            names_by_hash = {}
+            for filename, dedup_info, cached in chunk:
+                if cached is None:
+                    names_by_hash.setdefault(dedup_info["content_hash"], []).append(filename)
+            pending = [digest for digest in names_by_hash if digest not in row_of_hash]
+            pending_texts = [cv_texts[names_by_hash[digest][0]] for digest in pending]
+
+            # Embed and publish first, so the chunk's grades reach the live results before NER runs.
+            new_scores = {}
+            def publish(batch_indices, scores):
+                for j, score in zip(batch_indices, scores):
+                    new_scores[pending[j]] = score
+                if store is not None:
+                    store.upsert_many({"candidate_id": filename, "grade_score": score}
+                                      for j, score in zip(batch_indices, scores) for filename in names_by_hash[pending[j]])
+
+            self.grade_candidates(pending_texts, jd_embedding, on_batch=publish)
+            if store is not None:
+                # Copies of CVs graded in an earlier chunk.
+                embedding_scores = candidates.scores["embedding_score"]
+                store.upsert_many({"candidate_id": filename, "grade_score": embedding_scores[row_of_hash[digest]]}
+                                  for digest, names in names_by_hash.items() if digest in row_of_hash for filename in names)
+
+            # Entities for the new contents, in nlp.pipe batches; the prescreen skips NER.
+            new_entities = {digest: [] for digest in pending} if self.prescreen else \
+                dict(zip(pending, self.extract_cv_entities_batch(pending_texts)))
+
+            for filename, dedup_info, cached in chunk:
+                digest = dedup_info["content_hash"]
+                if cached is not None:
+                    score, entities = cached
+                elif digest in row_of_hash:
+                    source = row_of_hash[digest]
+                    score, entities = candidates.scores["embedding_score"][source], candidates.entities(source)
+                else:
+                    score, entities = new_scores[digest], new_entities[digest]
+                row = candidates.add(
+                    filename, entities, embedding_score=score,
+                    cv_text_preview=cv_texts[filename][:200],  # First 200 characters for preview
+                    dedup_status=dedup_info["status"],
+                    duplicate_of=dedup_info["duplicate_of"],
+                    dedup_cluster=dedup_info["cluster_id"]
+                )
+                if cached is None and digest not in row_of_hash:
+                    row_of_hash[digest] = row
+                    # Prescreened results lack entities, so they are not cached for reuse.
+                    if not self.prescreen:
+                        dedup.store_result(digest, jd_hash, score, entities)
+
+            # Keyword retrieval: update the inverted index with new/changed CVs.
+            changed += index.add_documents(cv_texts.items())
+
+        dedup.close()
+        print(f"DEBUG: Dedup: {dedup_counts['exact']} exact and {dedup_counts['near']} near duplicates "
+              f"out of {sum(dedup_counts.values())} CVs.")
+        print(f"DEBUG: Keyword index '{self.index_db}' updated ({changed} new or changed CVs).")
+        if score_keywords:
+            keyword_scores = index.score(jd_query_terms(reference_jd, jd_entities), doc_ids=candidates.candidate_ids)
+            candidates.set_scores("keyword_score", keyword_scores)
+        index.close()
+        return candidates
+
+    def fuse_results(self, candidates):
+        """Sets 'grade_score' on each candidate by fusing embedding and BM25 scores across the pool."""
+        ids = candidates.candidate_ids
+        fused_scores = fuse_scores(
+            dict(zip(ids, candidates.score_column("embedding_score").tolist())),
+            dict(zip(ids, candidates.score_column("keyword_score").tolist())),
+            embedding_weight=self.embedding_weight,
+            keyword_weight=self.keyword_weight
+        )
+        candidates.set_scores("grade_score", fused_scores)
+        return candidates
+
+    def shortlist_results(self, candidates, file_paths, shortlist):
+        """
+        Cascade cut: returns a store with the top `shortlist` candidates by grade_score,
+        extracting entities for any shortlisted CV the prescreen left without them.
+        """
+        order = np.argsort(-candidates.score_column("grade_score"), kind="stable")[:shortlist]
+        top_ids = [candidates.candidate_ids[i] for i in order]
+        paths_by_name = {os.path.basename(path): path for path in file_paths}
+        missing = [cid for cid in top_ids if not candidates.entities(candidates.row_of[cid])]
+        texts = [self.read_cv_text(paths_by_name[cid]) or "" for cid in missing]
+        entities_by_id = dict(zip(missing, self.extract_cv_entities_batch(texts)))
+        print(f"DEBUG: Shortlisted {len(top_ids)} of {len(candidates)} CVs; extracted entities for {len(missing)}.")
+        return candidates.subset(top_ids, entities_by_id)
+
+    def load_reference_jd(self, jd_csv_path, jd_index=0):
+        """
+        Reads 'optimized_jd' (and the JD agent's 'extracted_entities', if present) from one row
+        of the JD CSV. Returns (optimized_jd, extracted_entities).
         """
         # Read the JD CSV file
         try:
@@ -81,61 +284,48 @@ class CVParserGrader:
             print("Error: JD CSV must contain a non-empty 'optimized_jd' column.")
             sys.exit(1)
 
+        row = jd_df.iloc[jd_index]
+        return row['optimized_jd'], row['extracted_entities'] if 'extracted_entities' in jd_df.columns else None
+
+    def process_cv_folder(self, jd_csv_path, cv_folder, output_csv_path, shortlist=None, shortlist_path=None):
+        """
+        Reads 'optimized_jd' from the first row of the JD CSV (the output from the JD agent)
+        and uses it as the reference text for scoring CVs in the specified folder.
+        Supports PDF and TXT files. The candidates are saved to the candidate store the later
+        stages read, and a grading report is written to output_csv_path. With shortlist, the top
+        candidates are also saved to shortlist_path and only they are kept in the live results.
+        """
         # Use the first row's 'optimized_jd' as reference text.
-        reference_jd = jd_df.iloc[0]['optimized_jd']
-        jd_embedding = self.embedder.encode([reference_jd])
-        print("DEBUG: Successfully computed JD embedding from optimized_jd.")
+        reference_jd, jd_entities = self.load_reference_jd(jd_csv_path)
 
         if not os.path.isdir(cv_folder):
             print(f"Error: The CV folder '{cv_folder}' does not exist or is not a directory.")
             sys.exit(1)
 
-        results = []
-        processed_files = 0
-
-        # Process each file in the CV folder.
-        for filename in os.listdir(cv_folder):
-            file_path = os.path.join(cv_folder, filename)
-            if filename.lower().endswith(".pdf"):
-                processed_files += 1
-                print(f"DEBUG: Processing PDF file '{file_path}'.")
-                cv_text = self.extract_text_from_pdf(file_path)
-            elif filename.lower().endswith(".txt"):
-                processed_files += 1
-                print(f"DEBUG: Processing TXT file '{file_path}'.")
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        cv_text = f.read()
-                except Exception as e:
-                    print(f"Error reading TXT file '{file_path}': {e}")
-                    continue
-            else:
-                print(f"DEBUG: Skipping file '{file_path}' (unsupported file type).")
-                continue
-
-            if not cv_text.strip():
-                print(f"WARNING: No text extracted from '{file_path}'. Skipping.")
-                continue
-
-            # Extract entities from the CV text.
-            entities = self.extract_cv_entities(cv_text)
-            # Compute the grade (similarity score) using the JD embedding.
-            score = self.grade_candidate(cv_text, jd_embedding)
-
-            results.append({
-                "candidate_filename": filename,
-                "grade_score": score,
-                "extracted_entities": entities,
-                "cv_text_preview": cv_text[:200]  # First 200 characters for preview
-            })
+        file_paths = [os.path.join(cv_folder, filename) for filename in os.listdir(cv_folder)]
+        processed_files = sum(1 for path in file_paths if path.lower().endswith((".pdf", ".txt")))
+
+        # Publish each candidate as soon as it is scored so the dashboard can rank while we work.
+        store = ResultsStore(self.results_db)
+        candidates = self.fuse_results(self.grade_files(file_paths, reference_jd, jd_entities, store=store))
+        store.upsert_many({"candidate_id": cid, "grade_score": score}
+                          for cid, score in zip(candidates.candidate_ids, candidates.score_column("grade_score").tolist()))
+        if shortlist is not None:
+            shortlisted = self.shortlist_results(candidates, file_paths, shortlist)
+            store.retain(shortlisted.candidate_ids)
+            shortlisted.save(shortlist_path)
+            print(f"CV shortlist saved to: {shortlist_path}")
+        store.close()
 
         if processed_files == 0:
             print(f"WARNING: No supported CV files found in '{cv_folder}'. The output CSV will be empty.")
         else:
             print(f"DEBUG: Processed {processed_files} CV files from '{cv_folder}'.")
 
-        # Convert results to DataFrame and sort by grade_score in descending order.
-        results_df = pd.DataFrame(results)
+        # The store is what the later stages read; the CSV is a report sorted by grade_score.
+        candidates.save(self.store_path)
+        print(f"Candidate store saved to: {self.store_path}")
+        results_df = candidates.to_dataframe(CV_RESULT_COLUMNS[1:])
         if not results_df.empty:
             results_df.sort_values(by="grade_score", ascending=False, inplace=True)
             print(f"DEBUG: Sorted {len(results_df)} CV entries by grade_score.")
@@ -144,7 +334,6 @@ class CVParserGrader:
 
         results_df.to_csv(output_csv_path, index=False, encoding='utf-8')
         print(f"CV grading results saved to: {output_csv_path}")
-        print("DEBUG: Processing complete.")
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="CV Parser + Grader Agent (supports PDF and TXT)")
@@ -166,12 +355,81 @@ if __name__ == '__main__':
         default="cv_grading_results.csv",
         help="Path for the output CSV file. Default: cv_grading_results.csv"
     )
+    parser.add_argument(
+        "--index_db",
+        type=str,
+        default="cv_index.db",
+        help="Path to the persistent BM25 keyword index (kept next to memory.db). Default: cv_index.db"
+    )
+    parser.add_argument(
+        "--embedding_weight",
+        type=float,
+        default=0.7,
+        help="Weight of the semantic (embedding) score in grade_score. Default: 0.7"
+    )
+    parser.add_argument(
+        "--keyword_weight",
+        type=float,
+        default=0.3,
+        help="Weight of the BM25 keyword score in grade_score. Default: 0.3"
+    )
+
+    parser.add_argument(
+        "--results_db",
+        type=str,
+        default="memory.db",
+        help="SQLite DB holding the live results read by the dashboard. Default: memory.db"
+    )
+
+    parser.add_argument(
+        "--dedup_db",
+        type=str,
+        default="memory.db",
+        help="SQLite DB holding content hashes, MinHash signatures and reusable results. Default: memory.db"
+    )
+
+    parser.add_argument(
+        "--store_path",
+        type=str,
+        default="candidate_store.npz",
+        help="Path for the candidate store the later stages read. Default: candidate_store.npz"
+    )
+
+    parser.add_argument(
+        "--prescreen",
+        action="store_true",
+        help="Cascade stage 1: score the pool without NER (entities are extracted for the shortlist only)"
+    )
+
+    parser.add_argument(
+        "--shortlist",
+        type=int,
+        default=None,
+        help="Keep only the top M candidates for the later stages and save them to --shortlist_path"
+    )
+
+    parser.add_argument(
+        "--shortlist_path",
+        type=str,
+        default="cv_shortlist.npz",
+        help="Path for the shortlist candidate store written with --shortlist. Default: cv_shortlist.npz"
+    )
 
     args = parser.parse_args()
 
-    agent = CVParserGrader()
+    agent = CVParserGrader(
+        index_db=args.index_db,
+        embedding_weight=args.embedding_weight,
+        keyword_weight=args.keyword_weight,
+        results_db=args.results_db,
+        dedup_db=args.dedup_db,
+        store_path=args.store_path,
+        prescreen=args.prescreen
+    )
     agent.process_cv_folder(
         jd_csv_path=args.jd_csv,
         cv_folder=args.cv_folder,
-        output_csv_path=args.output_csv
+        output_csv_path=args.output_csv,
+        shortlist=args.shortlist,
+        shortlist_path=args.shortlist_path
     )
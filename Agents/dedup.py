@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+import re
+import json
+import time
+import zlib
+import random
+import hashlib
+import argparse
+import sqlite3
+from array import array
+
+MERSENNE_PRIME = (1 << 61) - 1
+SHINGLE_SIZE = 3
+
+def normalize_text(text):
+    """Lowercase and collapse whitespace so re-exported copies of a CV hash the same."""
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+def content_hash(text):
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+class DedupIndex:
+    """
+    Persistent duplicate detector for CV text, kept in memory.db. Exact resubmissions are found
+    by hashing the normalised text; near-duplicates (shared templates, small edits) by MinHash
+    signatures bucketed with LSH banding. Per-(CV content, JD) results are cached so duplicates
+    skip NER and embedding entirely.
+    """
+    def __init__(self, db_path="memory.db", num_perm=64, bands=16, threshold=0.8, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands.")
+        self.db_path = db_path
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        rng = random.Random(seed)
+        self.perms = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME)) for _ in range(num_perm)]
+        self.conn = sqlite3.connect(self.db_path, timeout=30)
+        self.create_tables()
+
+    def create_tables(self):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS DedupDocuments (
+                doc_id TEXT PRIMARY KEY,
+                content_hash TEXT,
+                cluster_id TEXT,
+                duplicate_of TEXT,
+                status TEXT,
+                signature BLOB,
+                created_at REAL
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_dedup_hash ON DedupDocuments (content_hash)")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS DedupBuckets (
+                band INTEGER,
+                bucket TEXT,
+                doc_id TEXT,
+                PRIMARY KEY (band, bucket, doc_id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS DedupResults (
+                content_hash TEXT,
+                jd_hash TEXT,
+                grade_score REAL,
+                extracted_entities TEXT,
+                PRIMARY KEY (content_hash, jd_hash)
+            )
+        ''')
+        self.conn.commit()
+
+    def signature(self, text):
+        """MinHash signature over word shingles of the normalised text."""
+        words = normalize_text(text).split()
+        shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))}
+        hashes = [zlib.crc32(s.encode("utf-8")) for s in shingles]
+        return array("Q", [min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in self.perms])
+
+    def band_keys(self, signature):
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows]
+            yield band, hashlib.md5(chunk.tobytes()).hexdigest()[:16]
+
+    def check(self, doc_id, text):
+        """
+        Classifies a CV and records it. Returns a dict with 'status' ('new', 'exact' or 'near'),
+        'content_hash', 'cluster_id', 'duplicate_of' and 'similarity'. Re-checking a known doc_id
+        returns its stored classification.
+        """
+        cursor = self.conn.cursor()
+        digest = content_hash(text)
+        row = cursor.execute(
+            "SELECT status, cluster_id, duplicate_of FROM DedupDocuments WHERE doc_id = ? AND content_hash = ?",
+            (doc_id, digest)
+        ).fetchone()
+        if row is not None:
+            return {"status": row[0], "content_hash": digest, "cluster_id": row[1],
+                    "duplicate_of": row[2], "similarity": 1.0 if row[0] == "exact" else None}
+
+        # The same doc_id with new content is treated as a fresh submission.
+        cursor.execute("DELETE FROM DedupDocuments WHERE doc_id = ?", (doc_id,))
+        cursor.execute("DELETE FROM DedupBuckets WHERE doc_id = ?", (doc_id,))
+
+        exact = cursor.execute(
+            "SELECT doc_id, cluster_id FROM DedupDocuments WHERE content_hash = ? ORDER BY created_at LIMIT 1", (digest,)
+        ).fetchone()
+        signature = self.signature(text)
+        keys = list(self.band_keys(signature))
+        if exact is not None:
+            result = {"status": "exact", "content_hash": digest, "cluster_id": exact[1],
+                      "duplicate_of": exact[0], "similarity": 1.0}
+        else:
+            result = {"status": "new", "content_hash": digest, "cluster_id": doc_id,
+                      "duplicate_of": None, "similarity": None}
+            candidates = set()
+            for band, bucket in keys:
+                candidates.update(r[0] for r in cursor.execute(
+                    "SELECT doc_id FROM DedupBuckets WHERE band = ? AND bucket = ?", (band, bucket)))
+            best = None
+            for other_id in candidates:
+                other = cursor.execute(
+                    "SELECT signature, cluster_id FROM DedupDocuments WHERE doc_id = ?", (other_id,)).fetchone()
+                if other is None:
+                    continue
+                other_sig = array("Q")
+                other_sig.frombytes(other[0])
+                similarity = sum(x == y for x, y in zip(signature, other_sig)) / self.num_perm
+                if similarity >= self.threshold and (best is None or similarity > best[0]):
+                    best = (similarity, other_id, other[1])
+            if best is not None:
+                result.update(status="near", similarity=best[0], duplicate_of=best[1], cluster_id=best[2])
+
+        cursor.execute(
+            "INSERT INTO DedupDocuments VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (doc_id, digest, result["cluster_id"], result["duplicate_of"], result["status"],
+             signature.tobytes(), time.time())
+        )
+        cursor.executemany("INSERT OR IGNORE INTO DedupBuckets VALUES (?, ?, ?)",
+                           [(band, bucket, doc_id) for band, bucket in keys])
+        self.conn.commit()
+        return result
+
+    def cached_result(self, digest, jd_hash):
+        """Returns (grade_score, extracted_entities) computed earlier for identical content, or None."""
+        row = self.conn.execute(
+            "SELECT grade_score, extracted_entities FROM DedupResults WHERE content_hash = ? AND jd_hash = ?",
+            (digest, jd_hash)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def store_result(self, digest, jd_hash, grade_score, entities):
+        self.conn.execute("INSERT OR REPLACE INTO DedupResults VALUES (?, ?, ?, ?)",
+                          (digest, jd_hash, float(grade_score), json.dumps(entities)))
+        self.conn.commit()
+
+    def report(self):
+        """Dedup rates over everything seen so far."""
+        counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM DedupDocuments GROUP BY status"))
+        total = sum(counts.values())
+        clusters = self.conn.execute(
+            "SELECT COUNT(*) FROM (SELECT cluster_id FROM DedupDocuments GROUP BY cluster_id HAVING COUNT(*) > 1)"
+        ).fetchone()[0]
+        return {
+            "documents": total,
+            "new": counts.get("new", 0),
+            "exact_duplicates": counts.get("exact", 0),
+            "near_duplicates": counts.get("near", 0),
+            "exact_rate": counts.get("exact", 0) / total if total else 0.0,
+            "near_rate": counts.get("near", 0) / total if total else 0.0,
+            "multi_member_clusters": clusters,
+        }
+
+    def close(self):
+        self.conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CV Dedup Report")
+    parser.add_argument("--db_path", type=str, default="memory.db",
+                        help="Path to SQLite DB (default: memory.db)")
+    args = parser.parse_args()
+
+    index = DedupIndex(args.db_path)
+    report = index.report()
+    index.close()
+    print(f"Documents seen:        {report['documents']}")
+    print(f"Exact duplicates:      {report['exact_duplicates']} ({report['exact_rate']:.1%})")
+    print(f"Near duplicates:       {report['near_duplicates']} ({report['near_rate']:.1%})")
+    print(f"Multi-member clusters: {report['multi_member_clusters']}")
@@ -4,6 +4,8 @@ import pandas as pd
 import numpy as np
 import shap
 from sklearn.linear_model import LinearRegression
+from results_store import ResultsStore
+from candidate_store import load_store
 
 def train_linear_model(df):
     """
@@ -36,24 +38,29 @@ def generate_explanations(df, model, X):
         explanations.append(explanation)
     return explanations
 
-def process_candidates(input_csv, output_csv):
-    df = pd.read_csv(input_csv, encoding="utf-8")
-    # Check for necessary columns.
-    for col in ['candidate_filename', 'grade_score', 'persona_fit_score']:
-        if col not in df.columns:
-            print(f"Error: Input CSV must contain the '{col}' column.")
-            exit(1)
+def process_candidates(store_path, output_csv, results_db="memory.db"):
+    candidates = load_store(store_path)
+    # Candidates a stage has not scored contribute nothing for that feature.
+    df = candidates.to_dataframe(['grade_score', 'persona_fit_score']).fillna(0.0)
     model, X = train_linear_model(df)
     explanations = generate_explanations(df, model, X)
     df["explanation"] = explanations
+    candidates.set_texts("explanation", dict(zip(df["candidate_filename"], explanations)))
+    candidates.save(store_path)
+    store = ResultsStore(results_db)
+    store.upsert_many({"candidate_id": cid, "explanation": text}
+                      for cid, text in zip(df["candidate_filename"], explanations))
+    store.close()
     df.to_csv(output_csv, index=False, encoding="utf-8")
     print(f"Explainability results saved to {output_csv}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Explainability Agent")
-    parser.add_argument("--input_csv", type=str, default="/Users/sridhrutitikkisetti/Desktop/Accenture/agents/persona_fit_results.csv",
-                        help="Input CSV from Persona-Fit Agent (default: persona_fit_results.csv)")
+    parser.add_argument("--store_path", type=str, default="candidate_store.npz",
+                        help="Candidate store from the earlier CV stages, updated in place (default: candidate_store.npz)")
     parser.add_argument("--output_csv", type=str, default="explainability_results.csv",
                         help="Output CSV file with candidate explanations (default: explainability_results.csv)")
+    parser.add_argument("--results_db", type=str, default="memory.db",
+                        help="SQLite DB holding the live results read by the dashboard (default: memory.db)")
     args = parser.parse_args()
-    process_candidates(args.input_csv, args.output_csv)
+    process_candidates(args.store_path, args.output_csv, args.results_db)
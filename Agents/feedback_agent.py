@@ -1,48 +1,329 @@
 #!/usr/bin/env python3
+import re
+import time
 import argparse
-import pandas as pd
+import sqlite3
+from results_store import ResultsStore
+from candidate_store import load_store
 
-def adjust_candidate_scores(input_csv, output_csv):
+# Score components recruiters can weigh in on, with the weights used before any feedback is learned:
+# updated_score = 0.4 * grade + 0.3 * persona fit + 0.3 * bias-free score, plus feedback adjustments.
+SCORE_COMPONENTS = ["grade_score", "persona_fit_score", "bias_free_score"]
+DEFAULT_WEIGHTS = {"grade_score": 0.4, "persona_fit_score": 0.3, "bias_free_score": 0.3}
+# Each biased term the bias agent flags takes this much off bias_free_score, down to 0.
+BIAS_PENALTY_PER_FLAG = 0.1
+# Flags are stored as str(list), e.g. "['ninja', 'guru']"; each quoted item is one flagged term.
+FLAG_PATTERN = r"'[^']*'"
+
+# Direct score nudges per recruiter action.
+EVENT_ADJUSTMENTS = {"thumbs_up": 0.05, "thumbs_down": -0.05}
+STAGE_ADJUSTMENTS = {"screening": 0.02, "interview": 0.05, "offer": 0.1, "hired": 0.1, "rejected": -0.1}
+EVENT_TYPES = {"thumbs_up", "thumbs_down", "stage_move", "override"}
+# The weights are re-learned on every pipeline run, and by a background update the dashboard
+# starts once this many labelled events are waiting (see FeedbackLog.weights_due).
+UPDATE_WEIGHTS_EVERY = 20
+# Events that carry a training label for the weight learner (see event_label).
+LABELLED_EVENTS = ("thumbs_up", "thumbs_down", "stage_move")
+
+def event_label(event_type, stage):
+    """Training label for the weight learner: 1 for positive signals, 0 for negative ones, None otherwise."""
+    if event_type == "thumbs_up":
+        return 1.0
+    if event_type == "thumbs_down":
+        return 0.0
+    if event_type == "stage_move":
+        return 0.0 if stage == "rejected" else 1.0
+    return None
+
+def bias_free_score(flags):
+    """1 minus BIAS_PENALTY_PER_FLAG per flagged term, floored at 0. flags is a list or its str() form."""
+    n_flags = len(re.findall(FLAG_PATTERN, flags)) if isinstance(flags, str) else len(flags or [])
+    return 1.0 - min(BIAS_PENALTY_PER_FLAG * n_flags, 1.0)
+
+def bias_free_scores(flags):
+    """Column-wise bias_free_score over a Series of stringified flag lists; missing flags count as none."""
+    penalty = (BIAS_PENALTY_PER_FLAG * flags.fillna("[]").str.count(FLAG_PATTERN)).clip(upper=1.0)
+    return 1.0 - penalty
+
+def score_candidate(components, weights, overrides=None, adjustment=0.0):
+    """
+    Composite score from the weighted components, with recruiter overrides replacing
+    component values. Returns (composite_score, updated_score).
+    """
+    values = dict(components, **(overrides or {}))
+    composite = sum(weights[c] * (values.get(c) or 0.0) for c in SCORE_COMPONENTS)
+    return composite, composite + adjustment
+
+class FeedbackLog:
     """
-    Simulate processing recruiter feedback. Here we compute a base composite score
-    (e.g. 0.6 * grade_score + 0.4 * persona_fit_score) and then apply a feedback 
-    adjustment based on simple string criteria found in the explanation.
-    
-    The input CSV is expected to include at least:
-      - 'candidate_filename'
-      - 'grade_score'
-      - 'persona_fit_score'
-      - 'explanation'
+    Append-only log of recruiter actions in the FeedbackEvents table of memory.db. Events are
+    keyed by the JD they were given against (by default the JD of the current live results),
+    so feedback on a CV only counts when ranking for that JD. Each new event recomputes
+    updated_score for its candidate only and writes it to the live results, so the dashboard
+    ranking reflects it immediately. The composite weights are re-learned from the log by
+    the pipeline's feedback stage and on demand (see update_weights), never on the click path.
     """
-    df = pd.read_csv(input_csv, encoding="utf-8")
-    # Check required columns.
-    for col in ['grade_score', 'persona_fit_score', 'explanation']:
-        if col not in df.columns:
-            print(f"Error: '{col}' column missing in input CSV.")
-            exit(1)
-    # Compute base composite score.
-    df['composite_score'] = 0.6 * df['grade_score'] + 0.4 * df['persona_fit_score']
-    
-    # Define a simple adjustment rule: 
-    # If the explanation contains the phrase "strong match", add 0.05; otherwise, subtract 0.02.
-    def feedback_adjust(explanation):
-        if isinstance(explanation, str) and "strong match" in explanation.lower():
-            return 0.05
+    def __init__(self, db_path="memory.db", jd_key=None):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(self.db_path, timeout=30)
+        self.store = ResultsStore(self.db_path)
+        self.jd_key = jd_key if jd_key is not None else self.store.jd_key()
+        self.create_tables()
+
+    def create_tables(self):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS FeedbackEvents (
+                event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                candidate_id TEXT NOT NULL,
+                event_type TEXT NOT NULL,
+                stage TEXT,
+                component TEXT,
+                value REAL,
+                created_at REAL,
+                jd_key TEXT,
+                trained INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        # Logs from before events were keyed by JD: their events keep a NULL key, and those the
+        # old watermark had passed count as trained.
+        existing = {row[1] for row in cursor.execute("PRAGMA table_info(FeedbackEvents)")}
+        if "jd_key" not in existing:
+            cursor.execute("ALTER TABLE FeedbackEvents ADD COLUMN jd_key TEXT")
+        if "trained" not in existing:
+            cursor.execute("ALTER TABLE FeedbackEvents ADD COLUMN trained INTEGER NOT NULL DEFAULT 0")
+            if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'FeedbackState'").fetchone():
+                cursor.execute('''
+                    UPDATE FeedbackEvents SET trained = 1 WHERE event_id <=
+                        (SELECT value FROM FeedbackState WHERE key = 'last_trained_event_id')
+                ''')
+        cursor.execute("DROP INDEX IF EXISTS idx_feedback_candidate")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_feedback_jd_candidate ON FeedbackEvents (jd_key, candidate_id, event_id)")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS FeedbackWeights (
+                component TEXT PRIMARY KEY,
+                weight REAL
+            )
+        ''')
+        stored = dict(cursor.execute("SELECT component, weight FROM FeedbackWeights"))
+        missing = [c for c in SCORE_COMPONENTS if c not in stored]
+        if stored and missing:
+            # Weights learned before a component existed keep their proportions in the share it leaves.
+            scale = 1.0 - sum(DEFAULT_WEIGHTS[c] for c in missing)
+            cursor.executemany("UPDATE FeedbackWeights SET weight = ? WHERE component = ?",
+                               [(weight * scale, c) for c, weight in stored.items()])
+        cursor.executemany("INSERT OR IGNORE INTO FeedbackWeights VALUES (?, ?)", DEFAULT_WEIGHTS.items())
+        self.conn.commit()
+
+    def weights(self):
+        return dict(self.conn.execute("SELECT component, weight FROM FeedbackWeights"))
+
+    def record_event(self, candidate_id, event_type, stage=None, component=None, value=None):
+        """
+        Appends one event under this log's JD key and returns the candidate's recomputed
+        updated_score. The weights are not re-learned here; see weights_due.
+        """
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f"Unknown feedback event '{event_type}'. Expected one of {sorted(EVENT_TYPES)}.")
+        if event_type == "stage_move" and stage not in STAGE_ADJUSTMENTS:
+            raise ValueError(f"Unknown stage '{stage}'. Expected one of {sorted(STAGE_ADJUSTMENTS)}.")
+        if event_type == "override" and (component not in SCORE_COMPONENTS or value is None):
+            raise ValueError(f"Overrides need a component in {SCORE_COMPONENTS} and a value.")
+        self.conn.execute(
+            "INSERT INTO FeedbackEvents (candidate_id, event_type, stage, component, value, created_at, jd_key) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (candidate_id, event_type, stage, component, value, time.time(), self.jd_key)
+        )
+        self.conn.commit()
+        return self.recompute_candidates([candidate_id]).get(candidate_id)
+
+    def thumbs_up(self, candidate_id):
+        return self.record_event(candidate_id, "thumbs_up")
+
+    def thumbs_down(self, candidate_id):
+        return self.record_event(candidate_id, "thumbs_down")
+
+    def move_stage(self, candidate_id, stage):
+        return self.record_event(candidate_id, "stage_move", stage=stage)
+
+    def override(self, candidate_id, component, value):
+        return self.record_event(candidate_id, "override", component=component, value=value)
+
+    def candidate_feedback(self, candidate_ids=None):
+        """
+        Folds the event log into per-candidate state: the summed score adjustment and the latest
+        override per component. Only this log's JD counts. Uses the (JD, candidate) index.
+        """
+        query = "SELECT candidate_id, event_type, stage, component, value FROM FeedbackEvents WHERE jd_key IS ?"
+        params = [self.jd_key]
+        if candidate_ids is not None:
+            query += f" AND candidate_id IN ({','.join('?' * len(candidate_ids))})"
+            params += list(candidate_ids)
+        feedback = {}
+        for candidate_id, event_type, stage, component, value in self.conn.execute(query + " ORDER BY event_id", params):
+            state = feedback.setdefault(candidate_id, {"adjustment": 0.0, "overrides": {}})
+            if event_type == "override":
+                state["overrides"][component] = value
+            elif event_type == "stage_move":
+                state["adjustment"] += STAGE_ADJUSTMENTS[stage]
+            else:
+                state["adjustment"] += EVENT_ADJUSTMENTS[event_type]
+        return feedback
+
+    def recompute_candidates(self, candidate_ids):
+        """Recomputes updated_score for the given candidates only and publishes it to the live results."""
+        weights = self.weights()
+        feedback = self.candidate_feedback(candidate_ids)
+        components = self.store.components(candidate_ids, SCORE_COMPONENTS)
+        updated = {}
+        for candidate_id, values in components.items():
+            state = feedback.get(candidate_id, {"adjustment": 0.0, "overrides": {}})
+            _, updated[candidate_id] = score_candidate(values, weights, state["overrides"], state["adjustment"])
+        self.store.upsert_many({"candidate_id": cid, "updated_score": score} for cid, score in updated.items())
+        return updated
+
+    def pending_events(self):
+        """Number of labelled events for this log's JD that the weights have not learned from yet."""
+        return self.conn.execute(
+            f"SELECT COUNT(*) FROM FeedbackEvents WHERE jd_key IS ? AND trained = 0 "
+            f"AND event_type IN ({','.join('?' * len(LABELLED_EVENTS))})",
+            (self.jd_key, *LABELLED_EVENTS)
+        ).fetchone()[0]
+
+    def weights_due(self):
+        """Whether enough events are waiting that the weights should be re-learned (UPDATE_WEIGHTS_EVERY)."""
+        return self.pending_events() >= UPDATE_WEIGHTS_EVERY
+
+    def update_weights(self, learning_rate=0.05):
+        """
+        Online least-squares update of the composite weights from this JD's labelled events
+        they have not learned from yet. Weights are kept non-negative and normalised to sum to 1
+        so scores stay on the same scale. Only events whose candidate is in the live results
+        can be learned from and are marked trained; the rest stay pending until a run for
+        their JD brings the candidate back. Rescores all candidates when the weights change.
+        Returns the number of events learned from.
+        """
+        # Hold the write lock while reading, so concurrent updates never learn an event twice.
+        self.conn.execute("BEGIN IMMEDIATE")
+        events = self.conn.execute(
+            f"SELECT event_id, candidate_id, event_type, stage FROM FeedbackEvents WHERE jd_key IS ? AND trained = 0 "
+            f"AND event_type IN ({','.join('?' * len(LABELLED_EVENTS))}) ORDER BY event_id",
+            (self.jd_key, *LABELLED_EVENTS)
+        ).fetchall()
+
+        weights = self.weights()
+        components = self.store.components(list({e[1] for e in events}), SCORE_COMPONENTS)
+        overrides = {cid: state["overrides"] for cid, state in self.candidate_feedback(list(components)).items()}
+        learned = []
+        for event_id, candidate_id, event_type, stage in events:
+            label = event_label(event_type, stage)
+            if label is None or candidate_id not in components:
+                continue
+            values = dict(components[candidate_id], **overrides.get(candidate_id, {}))
+            x = {c: values.get(c) or 0.0 for c in SCORE_COMPONENTS}
+            error = label - sum(weights[c] * x[c] for c in SCORE_COMPONENTS)
+            for c in SCORE_COMPONENTS:
+                weights[c] = max(weights[c] + learning_rate * error * x[c], 0.0)
+            learned.append(event_id)
+        if not learned:
+            self.conn.commit()
+            return 0
+
+        total = sum(weights.values())
+        if total > 0:
+            weights = {c: w / total for c, w in weights.items()}
         else:
-            return -0.02
-    
-    df['feedback_adjustment'] = df['explanation'].apply(feedback_adjust)
+            weights = dict(DEFAULT_WEIGHTS)
+        self.conn.executemany("INSERT OR REPLACE INTO FeedbackWeights VALUES (?, ?)", weights.items())
+        self.conn.executemany("UPDATE FeedbackEvents SET trained = 1 WHERE event_id = ?", [(e,) for e in learned])
+        self.conn.commit()
+        self.recompute_candidates(self.store.candidate_ids())
+        return len(learned)
+
+    def close(self):
+        self.store.close()
+        self.conn.close()
+
+def adjust_candidate_scores(store_path, output_csv, results_db="memory.db"):
+    """
+    Applies logged recruiter feedback to the pipeline's scores. The composite score uses the
+    learned weights (DEFAULT_WEIGHTS until feedback says otherwise),
+    recruiter overrides replace component values, and feedback_adjustment is the sum of the
+    candidate's thumbs and stage-move adjustments, all from events on the run's JD. The weights
+    are first re-learned from any of its events they have not learned from yet. Scores are read from and saved back to the
+    candidate store.
+    """
+    candidates = load_store(store_path)
+    df = candidates.to_dataframe(SCORE_COMPONENTS + ['cv_bias_flags'])
+    # Derive bias_free_score from the flags where the bias agent did not store it, as the
+    # supervisor does; any other component no stage has scored yet counts as 0.
+    missing = df['bias_free_score'].isna()
+    df.loc[missing, 'bias_free_score'] = bias_free_scores(df.loc[missing, 'cv_bias_flags'])
+    df[SCORE_COMPONENTS] = df[SCORE_COMPONENTS].fillna(0.0)
+
+    log = FeedbackLog(results_db)
+    learned = log.update_weights()
+    if learned:
+        print(f"Recruiter Feedback Agent: learned from {learned} new events, weights now {log.weights()}")
+    weights = log.weights()
+    feedback = log.candidate_feedback()
+    composite_scores = []
+    adjustments = []
+    for candidate_id, components in zip(df['candidate_filename'], df[SCORE_COMPONENTS].to_dict("records")):
+        state = feedback.get(candidate_id, {"adjustment": 0.0, "overrides": {}})
+        composite, _ = score_candidate(components, weights, state["overrides"])
+        composite_scores.append(composite)
+        adjustments.append(state["adjustment"])
+    df['composite_score'] = composite_scores
+    df['feedback_adjustment'] = adjustments
     df['updated_score'] = df['composite_score'] + df['feedback_adjustment']
-    
+    log.store.upsert_many({"candidate_id": cid, "updated_score": score}
+                          for cid, score in zip(df['candidate_filename'], df['updated_score']))
+    log.close()
+    for column in ['composite_score', 'feedback_adjustment', 'updated_score']:
+        candidates.set_scores(column, dict(zip(df['candidate_filename'], df[column])))
+    candidates.save(store_path)
+
     # Save the output CSV.
     df.to_csv(output_csv, index=False, encoding="utf-8")
     print(f"Recruiter Feedback Agent: Adjusted candidate scores saved to {output_csv}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Recruiter Feedback Agent")
-    parser.add_argument("--input_csv", type=str, default="/Users/sridhrutitikkisetti/Desktop/Accenture/agents/explainability_results.csv",
-                        help="Input CSV from Explainability Agent (default: explainability_results.csv)")
     parser.add_argument("--output_csv", type=str, default="feedback_adjusted_results.csv",
                         help="Output CSV with feedback-adjusted candidate scores (default: feedback_adjusted_results.csv)")
+    parser.add_argument("--results_db", type=str, default="memory.db",
+                        help="SQLite DB holding the live results read by the dashboard (default: memory.db)")
+    parser.add_argument("--store_path", type=str, default="candidate_store.npz",
+                        help="Candidate store from the earlier CV stages, updated in place (default: candidate_store.npz)")
+    parser.add_argument("--event", type=str, choices=sorted(EVENT_TYPES), default=None,
+                        help="Record one recruiter event instead of running the pipeline stage")
+    parser.add_argument("--candidate_id", type=str, default=None,
+                        help="Candidate the event applies to (e.g. C8063.pdf)")
+    parser.add_argument("--stage", type=str, choices=sorted(STAGE_ADJUSTMENTS), default=None,
+                        help="Target stage for a stage_move event")
+    parser.add_argument("--component", type=str, choices=SCORE_COMPONENTS, default=None,
+                        help="Score component for an override event")
+    parser.add_argument("--value", type=float, default=None,
+                        help="Override value for the component (0-1)")
+    parser.add_argument("--update_weights", action="store_true",
+                        help="Re-learn the composite weights now instead of waiting for the next run")
+    parser.add_argument("--jd_key", type=str, default=None,
+                        help="JD the event or update applies to (default: the JD of the current live results)")
     args = parser.parse_args()
-    adjust_candidate_scores(args.input_csv, args.output_csv)
+
+    if args.event or args.update_weights:
+        log = FeedbackLog(args.results_db, jd_key=args.jd_key)
+        if args.event:
+            if not args.candidate_id:
+                print("Error: --candidate_id is required with --event.")
+                exit(1)
+            score = log.record_event(args.candidate_id, args.event, stage=args.stage,
+                                     component=args.component, value=args.value)
+            print(f"Recruiter Feedback Agent: {args.event} recorded for {args.candidate_id} (updated_score={score})")
+        if args.update_weights or (args.event and log.weights_due()):
+            learned = log.update_weights()
+            print(f"Recruiter Feedback Agent: learned from {learned} events, weights now {log.weights()}")
+        log.close()
+    else:
+        adjust_candidate_scores(args.store_path, args.output_csv, args.results_db)
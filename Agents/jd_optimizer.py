@@ -7,22 +7,28 @@ import pandas as pd
 import spacy
 import re
 from transformers import pipeline
+from autotune import Autotuner, LengthBucketBatcher
 
 class JDExtractorOptimizer:
-    def __init__(self):
-        # Load spaCy model for NER and dependency parsing.
-        try:
-            self.nlp = spacy.load("en_core_web_sm")
-        except Exception as e:
-            print("Error loading spaCy model. Please install the model using:")
-            print("  python -m spacy download en_core_web_sm")
-            sys.exit(1)
+    def __init__(self, nlp=None):
+        # Load spaCy model for NER and dependency parsing, unless a loaded one is shared with us.
+        if nlp is not None:
+            self.nlp = nlp
+        else:
+            try:
+                self.nlp = spacy.load("en_core_web_sm")
+            except Exception as e:
+                print("Error loading spaCy model. Please install the model using:")
+                print("  python -m spacy download en_core_web_sm")
+                sys.exit(1)
         
         # Load a transformer-based model (T5-small) for text rephrasing
         self.rephraser = pipeline("text2text-generation", model="t5-small", tokenizer="t5-small")
 
         # Set a readability grade-level threshold; if above this, we rephrase the text.
         self.grade_level_threshold = 10.0
+        # Tuned lazily, only once some JD actually needs rephrasing.
+        self.batcher = None
 
     def count_syllables(self, word):
         """
@@ -89,6 +95,36 @@ class JDExtractorOptimizer:
 
         return optimized_text, grade_level
 
+    def get_batcher(self):
+        """Length-bucketed batcher sized by the autotuner for T5 on this host."""
+        if self.batcher is None:
+            # Short generations keep the one-off benchmark cheap; batch sizing is what is being measured.
+            settings = Autotuner().tune(
+                "t5-small", lambda texts: self.rephraser(texts, batch_size=len(texts), max_length=64)
+            )
+            self.batcher = LengthBucketBatcher.from_settings(settings, max_length=512)
+        return self.batcher
+
+    def optimize_jds(self, jd_texts):
+        """
+        Batched optimize_jd: every JD above the grade-level threshold is paraphrased by T5 in
+        length-bucketed batches. Returns a list of (optimized_text, grade_level) in input order.
+        """
+        grade_levels = [self.flesch_kincaid_grade(jd) for jd in jd_texts]
+        optimized = list(jd_texts)
+        to_rephrase = [i for i, grade in enumerate(grade_levels) if grade > self.grade_level_threshold]
+        if to_rephrase:
+            # Use T5-small for paraphrasing
+            prompts = ["paraphrase: " + jd_texts[i] for i in to_rephrase]
+            results = self.get_batcher().run(
+                lambda batch: self.rephraser(batch, batch_size=len(batch), max_length=512, num_return_sequences=1),
+                prompts
+            )
+            for i, result in zip(to_rephrase, results):
+                result = result[0] if isinstance(result, list) else result
+                optimized[i] = result['generated_text']
+        return list(zip(optimized, grade_levels))
+
     def process_jd_file(self, jd_csv_path, output_csv_path):
         # Read the CSV using the specified path. We assume "Job Title" and "Job Description" exist.
         try:
@@ -104,19 +140,11 @@ class JDExtractorOptimizer:
                 print(f"Error: CSV file must contain a '{col}' column.")
                 sys.exit(1)
 
-        # Prepare lists to store new columns
-        optimized_texts = []
-        grade_levels = []
-        extracted_entities_list = []
-
-        # Optimize each job description in the "Job Description" column
-        for jd in df["Job Description"]:
-            optimized_jd, grade_level = self.optimize_jd(jd)
-            entities = self.extract_entities(jd)
-            
-            optimized_texts.append(optimized_jd)
-            grade_levels.append(grade_level)
-            extracted_entities_list.append(entities)
+        # Optimize the job descriptions in the "Job Description" column in batches
+        optimized = self.optimize_jds(df["Job Description"].tolist())
+        optimized_texts = [text for text, _ in optimized]
+        grade_levels = [grade for _, grade in optimized]
+        extracted_entities_list = [self.extract_entities(jd) for jd in df["Job Description"]]
 
         # Attach new columns to the DataFrame
         df["optimized_jd"] = optimized_texts
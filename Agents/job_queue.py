@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import sqlite3
+import pandas as pd
+
+# Columns a worker writes back per (JD, CV) pair; collect turns them into the candidate store.
+RESULT_COLUMNS = [
+    "candidate_filename", "embedding_score", "keyword_score", "extracted_entities", "cv_text_preview",
+    "dedup_status", "duplicate_of", "dedup_cluster", "cv_bias_flags", "cv_anonymized", "persona_fit_score"
+]
+# Columns of the grading report written next to the candidate store.
+REPORT_COLUMNS = ["grade_score"] + [col for col in RESULT_COLUMNS[1:] if col != "extracted_entities"] + ["bias_free_score"]
+
+class JobQueue:
+    """
+    Durable work queue in SQLite, so scale-out runs need no external services. A coordinator
+    enqueues work units; workers on this or other hosts (sharing the DB file and CV folder)
+    lease units, process them and write results back. Leases expire, so units held by a worker
+    that died are picked up again; failed units are retried up to max_attempts.
+    """
+    def __init__(self, db_path="job_queue.db"):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        # Rollback journal rather than WAL: WAL relies on shared memory, so it only works when
+        # every process is on one host, and the queue is shared by workers on several hosts.
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.create_tables()
+
+    def create_tables(self):
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS Jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT,
+                status TEXT,
+                attempts INTEGER DEFAULT 0,
+                max_attempts INTEGER,
+                lease_owner TEXT,
+                lease_expires REAL,
+                error TEXT,
+                created_at REAL,
+                updated_at REAL
+            )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON Jobs (status, lease_expires)")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS JobResults (
+                jd_index INTEGER,
+                candidate_filename TEXT,
+                embedding_score REAL,
+                keyword_score REAL,
+                extracted_entities TEXT,
+                cv_text_preview TEXT,
+                dedup_status TEXT,
+                duplicate_of TEXT,
+                dedup_cluster TEXT,
+                cv_bias_flags TEXT,
+                cv_anonymized TEXT,
+                persona_fit_score REAL,
+                job_id INTEGER,
+                PRIMARY KEY (jd_index, candidate_filename)
+            )
+        ''')
+
+    def enqueue(self, payloads, max_attempts=3):
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.executemany(
+            "INSERT INTO Jobs (payload, status, max_attempts, created_at, updated_at) VALUES (?, 'pending', ?, ?, ?)",
+            [(json.dumps(p), max_attempts, now, now) for p in payloads]
+        )
+        self.conn.execute("COMMIT")
+
+    def claim(self, worker_id, lease_seconds=600):
+        """
+        Leases the oldest available unit: pending, or leased with an expired lease. Expired units
+        that have used up their attempts are marked failed instead. Returns (job_id, payload) or None.
+        """
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "UPDATE Jobs SET status = 'failed', error = 'lease expired', updated_at = ? "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= max_attempts",
+                (now, now)
+            )
+            row = self.conn.execute(
+                "SELECT job_id, payload FROM Jobs WHERE status = 'pending' "
+                "OR (status = 'leased' AND lease_expires < ?) ORDER BY job_id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is not None:
+                self.conn.execute(
+                    "UPDATE Jobs SET status = 'leased', attempts = attempts + 1, lease_owner = ?, "
+                    "lease_expires = ?, updated_at = ? WHERE job_id = ?",
+                    (worker_id, now + lease_seconds, now, row[0])
+                )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return (row[0], json.loads(row[1])) if row is not None else None
+
+    def complete(self, job_id, worker_id, results):
+        """
+        Writes a unit's results and marks it done in one transaction. Results are keyed by
+        (jd_index, candidate_filename), so a unit that runs twice overwrites rather than duplicates.
+        Returns False if the lease had already passed to another worker.
+        """
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO JobResults (jd_index, {', '.join(RESULT_COLUMNS)}, job_id) "
+                f"VALUES (?{', ?' * len(RESULT_COLUMNS)}, ?)",
+                [row + [job_id] for row in results]
+            )
+            updated = self.conn.execute(
+                "UPDATE Jobs SET status = 'done', error = NULL, updated_at = ? WHERE job_id = ? AND lease_owner = ?",
+                (now, job_id, worker_id)
+            ).rowcount
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return updated == 1
+
+    def fail(self, job_id, worker_id, error):
+        """Releases a unit after an error: back to pending while attempts remain, otherwise failed."""
+        self.conn.execute(
+            "UPDATE Jobs SET status = CASE WHEN attempts < max_attempts THEN 'pending' ELSE 'failed' END, "
+            "lease_owner = NULL, lease_expires = NULL, error = ?, updated_at = ? WHERE job_id = ? AND lease_owner = ?",
+            (error, time.time(), job_id, worker_id)
+        )
+
+    def status(self):
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM Jobs GROUP BY status"))
+
+    def failed_units(self, jd_index=0):
+        """Units for one JD that used up their attempts, as (job_id, number of CVs, last error)."""
+        failed = []
+        for job_id, payload, error in self.conn.execute(
+                "SELECT job_id, payload, error FROM Jobs WHERE status = 'failed' ORDER BY job_id"):
+            payload = json.loads(payload)
+            if payload["jd_index"] == jd_index:
+                failed.append((job_id, len(payload["cv_paths"]), error))
+        return failed
+
+    def results(self, jd_index=0):
+        return pd.read_sql_query(
+            f"SELECT {', '.join(RESULT_COLUMNS)} FROM JobResults WHERE jd_index = ?",
+            self.conn, params=(jd_index,)
+        )
+
+    def close(self):
+        self.conn.close()
+
+def enqueue_units(queue, jd_csv, cv_folder, shard_size=50, max_attempts=3):
+    """Coordinator: shards every (JD row, CV) pair into units of up to shard_size CVs for one JD."""
+    jd_df = pd.read_csv(jd_csv, encoding="utf-8")
+    cv_paths = sorted(os.path.abspath(os.path.join(cv_folder, f)) for f in os.listdir(cv_folder)
+                      if f.lower().endswith((".pdf", ".txt")))
+    payloads = [
+        {"jd_csv": os.path.abspath(jd_csv), "jd_index": jd_index, "cv_paths": cv_paths[i:i + shard_size]}
+        for jd_index in range(len(jd_df))
+        for i in range(0, len(cv_paths), shard_size)
+    ]
+    queue.enqueue(payloads, max_attempts=max_attempts)
+    print(f"Coordinator: enqueued {len(payloads)} units ({len(jd_df)} JDs x {len(cv_paths)} CVs, shard size {shard_size}).")
+
+def process_unit(grader, bias_agent, payload, score_keywords=True):
+    """
+    Runs the CV grading, bias and persona stages on one unit. Returns rows for JobResults.
+    With score_keywords=False the unit's CVs are only added to the keyword index, and their
+    keyword_score is left for score_keywords() to compute over the whole pool.
+    """
+    from bias_agent import detect_bias
+    from persona_agent import compute_persona_fits
+
+    reference_jd, jd_entities = grader.load_reference_jd(payload["jd_csv"], payload["jd_index"])
+    candidates = grader.grade_files(payload["cv_paths"], reference_jd, jd_entities, score_keywords=score_keywords)
+    ids = candidates.candidate_ids
+    previews = candidates.text_column("cv_text_preview")
+    redacted = bias_agent.redactor.redact_batch(previews)
+    distinct_previews = list(dict.fromkeys(previews))
+    persona_by_text = dict(zip(distinct_previews, compute_persona_fits(distinct_previews)))
+    candidates.set_texts("cv_bias_flags", {cid: str(detect_bias(text)) for cid, text in zip(ids, previews)})
+    candidates.set_texts("cv_anonymized", {cid: anonymized for cid, (anonymized, _) in zip(ids, redacted)})
+    candidates.set_scores("persona_fit_score", {cid: persona_by_text[text] for cid, text in zip(ids, previews)})
+
+    df = candidates.to_dataframe([col for col in RESULT_COLUMNS[1:] if col != "extracted_entities"], entities=True)
+    df["extracted_entities"] = df["extracted_entities"].map(json.dumps)
+    for col in ("embedding_score", "keyword_score", "persona_fit_score"):
+        df[col] = df[col].astype(float)
+    return [[payload["jd_index"]] + list(row) for row in df[RESULT_COLUMNS].itertuples(index=False)]
+
+def run_worker(queue_db, worker_id, lease_seconds=600, poll_interval=5.0, exit_when_empty=False,
+               index_db="cv_index.db", dedup_db="memory.db", models=None, threads=None):
+    """
+    Worker loop: leases and processes units until stopped. Models come from the parent when it
+    pre-forked this worker (see worker_pool.load_models), otherwise they are loaded here.
+    """
+    if threads:
+        from worker_pool import init_worker
+        init_worker(threads)
+    if models is None:
+        from worker_pool import load_models
+        models = load_models(index_db=index_db, dedup_db=dedup_db)
+    queue = JobQueue(queue_db)
+    print(f"Worker {worker_id}: ready.")
+    while True:
+        job = queue.claim(worker_id, lease_seconds=lease_seconds)
+        if job is None:
+            if exit_when_empty and not queue.status().get("leased"):
+                break
+            time.sleep(poll_interval)
+            continue
+        job_id, payload = job
+        try:
+            # BM25 needs pool-wide statistics, so it runs once in collect rather than per unit.
+            rows = process_unit(models["grader"], models["bias_agent"], payload, score_keywords=False)
+            if queue.complete(job_id, worker_id, rows):
+                print(f"Worker {worker_id}: unit {job_id} done ({len(rows)} CVs).")
+            else:
+                print(f"Worker {worker_id}: unit {job_id} lease was lost; results written idempotently.")
+        except Exception as e:
+            print(f"Worker {worker_id}: unit {job_id} failed: {e}")
+            queue.fail(job_id, worker_id, str(e))
+    queue.close()
+    print(f"Worker {worker_id}: queue drained, exiting.")
+
+def score_keywords(candidates, index_db, jd_csv, jd_index=0):
+    """
+    BM25-scores the whole pool once, after every unit has been indexed, against the one shared
+    index. IDF and average document length then do not depend on which shard or host indexed a CV.
+    """
+    from keyword_index import BM25Index, jd_query_terms
+
+    jd = pd.read_csv(jd_csv, encoding="utf-8").iloc[jd_index]
+    query = jd_query_terms(jd["optimized_jd"], jd.get("extracted_entities"))
+    index = BM25Index(index_db)
+    candidates.set_scores("keyword_score", index.score(query, doc_ids=candidates.candidate_ids))
+    index.close()
+    print(f"Scored {len(candidates)} candidates against keyword index {index_db}")
+
+def write_stage_outputs(candidates, output_csv, store_path, results_db="memory.db", embedding_weight=0.7,
+                        keyword_weight=0.3):
+    """
+    Fuses embedding and BM25 scores across the whole pool, saves the candidate store the
+    explainability and feedback stages read, writes the grading report, and publishes the
+    grading, bias and persona results to the live results, which the feedback loop and the
+    dashboard read.
+    """
+    from keyword_index import fuse_scores
+    from feedback_agent import bias_free_scores
+    from results_store import ResultsStore
+
+    ids = candidates.candidate_ids
+    # Workers store only the flags; score them here, column-wise, where no score is set yet.
+    bias_free = candidates.score_column("bias_free_score")
+    missing = pd.isna(bias_free)
+    flags = pd.Series(candidates.text_column("cv_bias_flags"), dtype=object)
+    bias_free[missing] = bias_free_scores(flags[missing]).to_numpy()
+    fused = fuse_scores(dict(zip(ids, candidates.score_column("embedding_score").tolist())),
+                        dict(zip(ids, candidates.score_column("keyword_score").tolist())),
+                        embedding_weight=embedding_weight, keyword_weight=keyword_weight)
+    candidates.set_scores("grade_score", fused)
+    candidates.save(store_path)
+    print(f"Saved {len(candidates)} candidates to {store_path}")
+    live = candidates.to_dataframe(["grade_score", "cv_bias_flags", "bias_free_score", "persona_fit_score"])
+    store = ResultsStore(results_db)
+    store.upsert_many(live.rename(columns={"candidate_filename": "candidate_id"}).to_dict("records"))
+    store.close()
+    report = candidates.to_dataframe(REPORT_COLUMNS).sort_values("grade_score", ascending=False)
+    report.to_csv(output_csv, index=False, encoding="utf-8")
+    print(f"Wrote the grading report to {output_csv}")
+
+def collect_results(queue_db, jd_index, output_csv, store_path, jd_csv="optimized_jds.csv", index_db="cv_index.db",
+                    results_db="memory.db", embedding_weight=0.7, keyword_weight=0.3, allow_failed=False):
+    """
+    Gathers one JD's results from the queue, BM25-scores the pool against the shared index and
+    writes the candidate store and the grading report. Units that failed for good would
+    silently drop their CVs from the ranking, so they are listed with their errors and the
+    collect stops, unless allow_failed is set.
+    """
+    from candidate_store import CandidateStore
+
+    queue = JobQueue(queue_db)
+    pending = {k: v for k, v in queue.status().items() if k in ("pending", "leased")}
+    if pending:
+        print(f"WARNING: units still in progress {pending}; collecting partial results.")
+    failed = queue.failed_units(jd_index)
+    if failed:
+        print(f"{'WARNING' if allow_failed else 'Error'}: {len(failed)} units for JD {jd_index} failed, "
+              f"so {sum(n for _, n, _ in failed)} CVs have no results:")
+        for job_id, n_cvs, error in failed:
+            print(f"  unit {job_id} ({n_cvs} CVs): {error}")
+        if not allow_failed:
+            queue.close()
+            print("Fix the errors and run the coordinator again, or pass --allow_failed to rank without those CVs.")
+            sys.exit(1)
+    df = queue.results(jd_index)
+    queue.close()
+    print(f"Collected {len(df)} candidates for JD {jd_index}.")
+    candidates = CandidateStore.from_dataframe(df)
+    score_keywords(candidates, index_db, jd_csv, jd_index)
+    write_stage_outputs(candidates, output_csv, store_path, results_db=results_db,
+                        embedding_weight=embedding_weight, keyword_weight=keyword_weight)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HireSense | Scale-out Job Queue")
+    parser.add_argument("command", choices=["coordinator", "worker", "collect", "status"],
+                        help="coordinator: enqueue units; worker: process units; collect: write stage CSVs; status: show counts")
+    parser.add_argument("--queue_db", type=str, default="job_queue.db",
+                        help="SQLite queue file; must be on storage every worker host can reach (default: job_queue.db)")
+    parser.add_argument("--jd_csv", type=str, default="optimized_jds.csv",
+                        help="CSV from the JD agent, read by the coordinator and by collect (default: optimized_jds.csv)")
+    parser.add_argument("--cv_folder", type=str, default="Dataset/CVs1",
+                        help="Folder of CVs, at the same path on every worker host (default: Dataset/CVs1)")
+    parser.add_argument("--shard_size", type=int, default=50,
+                        help="CVs per work unit (default: 50)")
+    parser.add_argument("--max_attempts", type=int, default=3,
+                        help="Attempts per unit before it is marked failed (default: 3)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Worker processes to start on this host (default: 1)")
+    parser.add_argument("--lease_seconds", type=float, default=600,
+                        help="Seconds a worker may hold a unit before it is handed out again (default: 600)")
+    parser.add_argument("--exit_when_empty", action="store_true",
+                        help="Stop workers once no units are pending or leased")
+    parser.add_argument("--jd_index", type=int, default=0,
+                        help="JD row to collect results for (default: 0)")
+    parser.add_argument("--output_csv", type=str, default="cv_grading_results.csv",
+                        help="Grading report to write when collecting (default: cv_grading_results.csv)")
+    parser.add_argument("--store_path", type=str, default="candidate_store.npz",
+                        help="Candidate store to write when collecting (default: candidate_store.npz)")
+    parser.add_argument("--index_db", type=str, default="cv_index.db",
+                        help="BM25 keyword index; on shared storage when workers run on several hosts (default: cv_index.db)")
+    parser.add_argument("--dedup_db", type=str, default="memory.db",
+                        help="Dedup index; use a separate file on shared storage when workers run on several hosts "
+                             "(default: memory.db)")
+    parser.add_argument("--results_db", type=str, default="memory.db",
+                        help="Live results DB that collect publishes grades, bias flags and persona scores to (default: memory.db)")
+    parser.add_argument("--allow_failed", action="store_true",
+                        help="Collect even if some units failed, ranking without their CVs")
+    args = parser.parse_args()
+
+    if args.command == "coordinator":
+        queue = JobQueue(args.queue_db)
+        enqueue_units(queue, args.jd_csv, args.cv_folder, shard_size=args.shard_size, max_attempts=args.max_attempts)
+        queue.close()
+    elif args.command == "worker":
+        # Load the models once here and fork the workers, so they share the weights copy-on-write.
+        from worker_pool import load_models, prepare_fork
+
+        host = socket.gethostname()
+        models = load_models(index_db=args.index_db, dedup_db=args.dedup_db)
+        threads = max(1, (os.cpu_count() or 1) // args.processes)
+        ctx = prepare_fork()
+        workers = [
+            ctx.Process(
+                target=run_worker,
+                args=(args.queue_db, f"{host}-{os.getpid()}-{i}", args.lease_seconds),
+                kwargs={"exit_when_empty": args.exit_when_empty, "models": models, "threads": threads}
+            )
+            for i in range(args.processes)
+        ]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        sys.exit(max((w.exitcode or 0) for w in workers))
+    elif args.command == "collect":
+        collect_results(args.queue_db, args.jd_index, args.output_csv, args.store_path,
+                        jd_csv=args.jd_csv, index_db=args.index_db, results_db=args.results_db,
+                        allow_failed=args.allow_failed)
+    else:
+        queue = JobQueue(args.queue_db)
+        print(queue.status())
+        queue.close()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+import os
+import re
+import ast
+import math
+import hashlib
+import argparse
+import sqlite3
+
+# Tokens keep the characters that matter in skill names (c++, c#, node.js, ci/cd).
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#./-]*[a-z0-9+#]|[a-z0-9]")
+
+# Common English words that carry no signal for skill matching.
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is", "it",
+    "its", "of", "on", "or", "our", "that", "the", "their", "this", "to", "we", "will", "with", "you",
+    "your", "who", "which", "while", "into", "about", "across", "within", "using", "etc"
+}
+
+def tokenize(text):
+    """Lowercase the text and split it into index terms, dropping stopwords."""
+    if not isinstance(text, str):
+        return []
+    return [tok for tok in TOKEN_PATTERN.findall(text.lower()) if tok not in STOPWORDS]
+
+# A restricted score reads the query terms' postings and filters them by the pool unless the
+# pool needs this many times fewer (doc, term) lookups than there are postings; each lookup
+# costs about as much as reading this many postings in order.
+POOL_LOOKUP_COST = 3
+
+def jd_query_terms(optimized_jd, extracted_entities=None):
+    """
+    Builds the BM25 query for a job description: the terms of 'optimized_jd' plus the terms
+    of the JD agent's noun phrases and named entities. Terms that appear in both are counted
+    twice, so skills the JD agent singled out weigh more than incidental wording.
+    """
+    terms = tokenize(optimized_jd)
+    if isinstance(extracted_entities, str):
+        try:
+            extracted_entities = ast.literal_eval(extracted_entities)
+        except (ValueError, SyntaxError):
+            extracted_entities = None
+    if isinstance(extracted_entities, dict):
+        for phrase in extracted_entities.get("noun_phrases", []):
+            terms.extend(tokenize(phrase))
+        for ent in extracted_entities.get("entities", []):
+            terms.extend(tokenize(ent.get("text", "")))
+    return terms
+
+class BM25Index:
+    """
+    Persistent inverted index over CV text, stored in its own SQLite file next to memory.db.
+    Postings are keyed by term so a query only touches the rows of the terms it asks for.
+    """
+    def __init__(self, db_path="cv_index.db", k1=1.5, b=0.75):
+        self.db_path = db_path
+        self.k1 = k1
+        self.b = b
+        # Several grader processes may update the index at once, so wait on locks instead of failing.
+        # Rollback journal rather than WAL: WAL needs shared memory on one host, and queue workers
+        # on several hosts may share this file over the network.
+        self.conn = sqlite3.connect(self.db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.create_tables()
+
+    def create_tables(self):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS Documents (
+                doc_id TEXT PRIMARY KEY,
+                content_hash TEXT,
+                doc_length INTEGER
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS Terms (
+                term TEXT PRIMARY KEY,
+                doc_freq INTEGER
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS Postings (
+                term TEXT,
+                doc_id TEXT,
+                term_freq INTEGER,
+                PRIMARY KEY (term, doc_id)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_postings_doc ON Postings (doc_id)")
+        self.conn.commit()
+
+    def _remove_postings(self, cursor, doc_id, doc_freq_delta):
+        for (term,) in cursor.execute("SELECT term FROM Postings WHERE doc_id = ?", (doc_id,)).fetchall():
+            doc_freq_delta[term] = doc_freq_delta.get(term, 0) - 1
+        cursor.execute("DELETE FROM Postings WHERE doc_id = ?", (doc_id,))
+
+    def add_documents(self, docs):
+        """
+        Adds or refreshes (doc_id, text) pairs in a single transaction. Documents whose content
+        has not changed since the last run are skipped, so re-running the grader over the same
+        folder only indexes new or edited CVs. Returns the number of documents (re)indexed.
+        """
+        cursor = self.conn.cursor()
+        known = dict(cursor.execute("SELECT doc_id, content_hash FROM Documents"))
+        doc_freq_delta = {}
+        documents = []
+        postings = []
+        for doc_id, text in docs:
+            content_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+            if known.get(doc_id) == content_hash:
+                continue
+            if doc_id in known:
+                self._remove_postings(cursor, doc_id, doc_freq_delta)
+            known[doc_id] = content_hash
+
+            tokens = tokenize(text)
+            counts = {}
+            for tok in tokens:
+                counts[tok] = counts.get(tok, 0) + 1
+            documents.append((doc_id, content_hash, len(tokens)))
+            postings.extend((term, doc_id, tf) for term, tf in counts.items())
+            for term in counts:
+                doc_freq_delta[term] = doc_freq_delta.get(term, 0) + 1
+
+        cursor.executemany("INSERT OR REPLACE INTO Documents VALUES (?, ?, ?)", documents)
+        cursor.executemany("INSERT INTO Postings VALUES (?, ?, ?)", postings)
+        cursor.executemany(
+            "INSERT INTO Terms VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET doc_freq = doc_freq + excluded.doc_freq",
+            [(term, delta) for term, delta in doc_freq_delta.items() if delta]
+        )
+        self.conn.commit()
+        return len(documents)
+
+    def add_document(self, doc_id, text):
+        """Adds or refreshes one CV. Returns True if the index was modified."""
+        return self.add_documents([(doc_id, text)]) == 1
+
+    def remove_document(self, doc_id):
+        cursor = self.conn.cursor()
+        doc_freq_delta = {}
+        self._remove_postings(cursor, doc_id, doc_freq_delta)
+        cursor.executemany("UPDATE Terms SET doc_freq = doc_freq + ? WHERE term = ?",
+                           [(delta, term) for term, delta in doc_freq_delta.items()])
+        cursor.execute("DELETE FROM Documents WHERE doc_id = ?", (doc_id,))
+        self.conn.commit()
+
+    def score(self, query_terms, doc_ids=None, max_doc_ratio=0.5, min_docs_to_prune=1000):
+        """
+        Scores documents against the query with Okapi BM25. Repeated query terms weigh
+        proportionally more. If doc_ids is given, only those documents are scored (documents
+        without any matching term score 0.0): a pool that is small next to the query terms'
+        postings is looked up in SQL, a larger one filters the postings instead.
+        On large indexes (min_docs_to_prune documents or more), query terms found in more than
+        max_doc_ratio of the documents are dropped: their IDF is near zero, but their postings
+        would be most of the rows read.
+        """
+        cursor = self.conn.cursor()
+        n_docs, total_length = cursor.execute("SELECT COUNT(*), COALESCE(SUM(doc_length), 0) FROM Documents").fetchone()
+        scores = {doc_id: 0.0 for doc_id in doc_ids} if doc_ids is not None else {}
+        if n_docs == 0 or not query_terms:
+            return scores
+        avg_length = total_length / n_docs
+
+        query_weights = {}
+        for term in query_terms:
+            query_weights[term] = query_weights.get(term, 0) + 1
+        terms = list(query_weights)
+        placeholders = ",".join("?" * len(terms))
+
+        idf = {}
+        postings = 0
+        for term, doc_freq in cursor.execute(f"SELECT term, doc_freq FROM Terms WHERE term IN ({placeholders})", terms):
+            if doc_freq <= 0:
+                continue
+            if n_docs >= min_docs_to_prune and doc_freq > max_doc_ratio * n_docs:
+                continue
+            idf[term] = math.log(1 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+            postings += doc_freq
+        if not idf:
+            return scores
+
+        matched = list(idf)
+        placeholders = ",".join("?" * len(matched))
+        if doc_ids is None or POOL_LOOKUP_COST * postings <= len(scores) * len(matched):
+            # Read the query terms' postings and drop documents outside the pool here.
+            rows = cursor.execute(f'''
+                SELECT p.term, p.doc_id, p.term_freq, d.doc_length
+                FROM Postings p JOIN Documents d ON d.doc_id = p.doc_id
+                WHERE p.term IN ({placeholders})
+            ''', matched).fetchall()
+            if doc_ids is not None:
+                rows = [row for row in rows if row[1] in scores]
+        else:
+            # A pool much smaller than the postings goes into a temp table so the join reads only its postings.
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS QueryDocs (doc_id TEXT PRIMARY KEY)")
+            cursor.execute("DELETE FROM QueryDocs")
+            cursor.executemany("INSERT OR IGNORE INTO QueryDocs VALUES (?)", [(doc_id,) for doc_id in scores])
+            rows = cursor.execute(f'''
+                SELECT p.term, p.doc_id, p.term_freq, d.doc_length
+                FROM QueryDocs q
+                JOIN Postings p ON p.doc_id = q.doc_id AND p.term IN ({placeholders})
+                JOIN Documents d ON d.doc_id = q.doc_id
+            ''', matched).fetchall()
+            cursor.execute("DELETE FROM QueryDocs")
+            self.conn.commit()
+        for term, doc_id, tf, doc_length in rows:
+            norm = self.k1 * (1 - self.b + self.b * doc_length / avg_length)
+            scores[doc_id] = scores.get(doc_id, 0.0) + query_weights[term] * idf[term] * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def top_k(self, query_terms, k=10):
+        scores = self.score(query_terms)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def close(self):
+        self.conn.close()
+
+def fuse_scores(embedding_scores, keyword_scores, embedding_weight=0.7, keyword_weight=0.3):
+    """
+    Combines cosine similarity and BM25 into one grade. BM25 is unbounded, so it is scaled
+    by the best keyword score in the pool before weighting; weights are normalised to sum to 1.
+    """
+    total_weight = embedding_weight + keyword_weight
+    if total_weight <= 0:
+        raise ValueError("embedding_weight + keyword_weight must be positive.")
+    max_keyword = max(keyword_scores.values(), default=0.0)
+    fused = {}
+    for doc_id, emb in embedding_scores.items():
+        kw = keyword_scores.get(doc_id, 0.0) / max_keyword if max_keyword > 0 else 0.0
+        fused[doc_id] = (embedding_weight * emb + keyword_weight * kw) / total_weight
+    return fused
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BM25 Keyword Index over CV text")
+    parser.add_argument("--index_db", type=str, default="cv_index.db",
+                        help="Path to the inverted index SQLite file (default: cv_index.db)")
+    parser.add_argument("--query", type=str, required=True,
+                        help="Free-text keyword query, e.g. 'kubernetes terraform aws'")
+    parser.add_argument("--top_k", type=int, default=10,
+                        help="Number of candidates to return (default: 10)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.index_db):
+        print(f"Error: index '{args.index_db}' not found. Run cv_grader.py first.")
+        exit(1)
+    index = BM25Index(args.index_db)
+    for doc_id, score in index.top_k(tokenize(args.query), k=args.top_k):
+        print(f"{score:8.3f}  {doc_id}")
+    index.close()
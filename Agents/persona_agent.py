@@ -2,6 +2,9 @@
 import argparse
 import pandas as pd
 from transformers import pipeline
+from results_store import ResultsStore
+from candidate_store import load_store
+from autotune import Autotuner, LengthBucketBatcher
 
 # Load a sentiment analysis pipeline (e.g., using distilbert fine-tuned on SST-2).
 sentiment_pipeline = pipeline("sentiment-analysis")  # Default model: distilbert-base-uncased-finetuned-sst-2-english
@@ -9,44 +12,84 @@ sentiment_pipeline = pipeline("sentiment-analysis")  # Default model: distilbert
 # A production system would include a more sophisticated set or model for soft skills.
 SOFT_SKILLS_KEYWORDS = {"team", "collaborative", "leader", "innovative", "adaptable", "communicative", "proactive"}
 
-def compute_persona_fit(cv_text):
+def persona_fit_from_sentiment(cv_text, sentiment):
     """
     Compute a persona fit score based on the positive sentiment score (proxy for friendly, collaborative tone)
     and the frequency of soft-skills keywords.
     """
-    # Get sentiment for the entire text (this might be chunked in production for very long texts).
-    sentiment_result = sentiment_pipeline(cv_text)
     # Assume positive sentiment score if label is POSITIVE.
-    positive_score = sentiment_result[0]["score"] if sentiment_result[0]["label"] == "POSITIVE" else 0.0
-    
+    positive_score = sentiment["score"] if sentiment["label"] == "POSITIVE" else 0.0
+
     # Count frequency of soft skills keywords.
     text_lower = cv_text.lower()
     keyword_count = sum(text_lower.count(word) for word in SOFT_SKILLS_KEYWORDS)
     # Normalize the keyword count into a 0-1 scale (tuning factor, e.g. max expected count = 20).
     soft_score = min(keyword_count / 20.0, 1.0)
-    
+
     # Combine sentiment (70%) and soft skills (30%) into a persona fit score.
     persona_fit_score = 0.7 * positive_score + 0.3 * soft_score
     return persona_fit_score
 
-def process_cv_file(input_csv, output_csv):
-    df = pd.read_csv(input_csv, encoding="utf-8")
-    if "cv_text_preview" not in df.columns:
-        print("Error: Input CV CSV must contain 'cv_text_preview' column.")
-        exit(1)
-    persona_fit_scores = []
-    for text in df["cv_text_preview"]:
-        score = compute_persona_fit(text)
-        persona_fit_scores.append(score)
-    df["persona_fit_score"] = persona_fit_scores
-    df.to_csv(output_csv, index=False, encoding="utf-8")
+def compute_persona_fit(cv_text):
+    # Get sentiment for the entire text (this might be chunked in production for very long texts).
+    sentiment_result = sentiment_pipeline(cv_text)
+    return persona_fit_from_sentiment(cv_text, sentiment_result[0])
+
+_batcher = None
+
+def get_batcher():
+    """Length-bucketed batcher sized by the autotuner for the sentiment model on this host."""
+    global _batcher
+    if _batcher is None:
+        settings = Autotuner().tune(
+            sentiment_pipeline.model.name_or_path,
+            lambda texts: sentiment_pipeline(texts, batch_size=len(texts), truncation=True)
+        )
+        _batcher = LengthBucketBatcher.from_settings(settings, max_length=sentiment_pipeline.tokenizer.model_max_length)
+    return _batcher
+
+def compute_persona_fits(cv_texts, on_batch=None):
+    """
+    Batched compute_persona_fit: runs sentiment over length-bucketed batches and returns the
+    scores in input order. on_batch(indices, scores) is called as each batch finishes.
+    """
+    def score_batch(texts):
+        sentiments = sentiment_pipeline(texts, batch_size=len(texts), truncation=True)
+        return [persona_fit_from_sentiment(text, sentiment) for text, sentiment in zip(texts, sentiments)]
+    return get_batcher().run(score_batch, cv_texts, on_batch=on_batch)
+
+def process_cv_file(store_path, output_csv, results_db="memory.db"):
+    """Scores persona fit for every CV preview in the candidate store and saves it back."""
+    candidates = load_store(store_path)
+    previews = [text or "" for text in candidates.text_column("cv_text_preview")]
+    store = ResultsStore(results_db)
+    # Duplicate CVs share their preview text, so each distinct text is scored once.
+    candidates_by_text = {}
+    for candidate_id, text in zip(candidates.candidate_ids, previews):
+        candidates_by_text.setdefault(text, []).append(candidate_id)
+    texts = list(candidates_by_text)
+
+    # Publish per batch so the dashboard's persona column fills in live.
+    def publish(indices, scores):
+        store.upsert_many({"candidate_id": cid, "persona_fit_score": score}
+                          for i, score in zip(indices, scores) for cid in candidates_by_text[texts[i]])
+
+    scores_by_text = dict(zip(texts, compute_persona_fits(texts, on_batch=publish)))
+    store.close()
+    persona_fit_scores = [scores_by_text[text] for text in previews]
+    candidates.set_scores("persona_fit_score", dict(zip(candidates.candidate_ids, persona_fit_scores)))
+    candidates.save(store_path)
+    pd.DataFrame({"candidate_filename": candidates.candidate_ids, "persona_fit_score": persona_fit_scores}).to_csv(
+        output_csv, index=False, encoding="utf-8")
     print(f"Persona-Fit results saved to {output_csv}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Persona-Fit Agent")
-    parser.add_argument("--input_csv", type=str, default="/Users/sridhrutitikkisetti/Desktop/Accenture/agents/cv_bias_fairness.csv",
-                        help="Input CV CSV from Bias & Fairness Agent (default: cv_bias_fairness.csv)")
     parser.add_argument("--output_csv", type=str, default="persona_fit_results.csv",
                         help="Output CSV with persona fit scores (default: persona_fit_results.csv)")
+    parser.add_argument("--results_db", type=str, default="memory.db",
+                        help="SQLite DB holding the live results read by the dashboard (default: memory.db)")
+    parser.add_argument("--store_path", type=str, default="candidate_store.npz",
+                        help="Candidate store from the earlier CV stages, updated in place (default: candidate_store.npz)")
     args = parser.parse_args()
-    process_cv_file(args.input_csv, args.output_csv)
+    process_cv_file(args.store_path, args.output_csv, args.results_db)
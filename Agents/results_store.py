@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+import os
+import time
+import hashlib
+import argparse
+import sqlite3
+import pandas as pd
+
+# Columns each stage fills in as it finishes a candidate.
+RESULT_COLUMNS = ["grade_score", "cv_bias_flags", "bias_free_score", "persona_fit_score", "explanation", "updated_score"]
+TEXT_COLUMNS = {"cv_bias_flags", "explanation"}
+
+def jd_key(jd_csv, jd_index=0):
+    """
+    Identifies the JD a run ranks against: a hash of the JD CSV's contents plus the row used,
+    so rerunning the same JD gives the same key. Falls back to the path if the file is missing.
+    """
+    if not os.path.exists(jd_csv):
+        return f"{jd_csv}:{jd_index}"
+    with open(jd_csv, "rb") as f:
+        return f"{hashlib.sha1(f.read()).hexdigest()}:{jd_index}"
+
+def to_sql_value(column, value):
+    """Converts numpy scalars and lists into values sqlite3 can bind."""
+    if value is None:
+        return None
+    return str(value) if column in TEXT_COLUMNS else float(value)
+
+class ResultsStore:
+    """
+    Live candidate results shared by the agents and the dashboard. Stages upsert their
+    columns per candidate while they run, and the dashboard reads ranked pages from it
+    without waiting for the pipeline to finish. Lives in the LiveResults table of memory.db,
+    separate from the Candidates table that sql_agent rebuilds on every run.
+    """
+    def __init__(self, db_path="memory.db"):
+        self.db_path = db_path
+        # Agents write while the dashboard reads, so use WAL and wait on locks instead of failing.
+        self.conn = sqlite3.connect(self.db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.create_table()
+
+    def create_table(self):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS LiveResults (
+                candidate_id TEXT PRIMARY KEY,
+                grade_score REAL,
+                cv_bias_flags TEXT,
+                bias_free_score REAL,
+                persona_fit_score REAL,
+                explanation TEXT,
+                updated_score REAL,
+                rank_score REAL,
+                updated_at REAL
+            )
+        ''')
+        # Tables created before bias_free_score was a score component lack its column.
+        existing = {row[1] for row in cursor.execute("PRAGMA table_info(LiveResults)")}
+        if "bias_free_score" not in existing:
+            cursor.execute("ALTER TABLE LiveResults ADD COLUMN bias_free_score REAL")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_live_rank ON LiveResults (rank_score DESC)")
+        # Run-level settings, such as which JD the live results are ranked against.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS LiveResultsState (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+        self.conn.commit()
+
+    def reset(self, jd_key=None):
+        """Clears results from a previous run and records the key of the JD this run ranks against."""
+        self.conn.execute("DELETE FROM LiveResults")
+        self.conn.execute("INSERT OR REPLACE INTO LiveResultsState VALUES ('jd_key', ?)", (jd_key,))
+        self.conn.commit()
+
+    def jd_key(self):
+        """Key of the JD the live results are ranked against (see jd_key()), or None if no run set one."""
+        row = self.conn.execute("SELECT value FROM LiveResultsState WHERE key = 'jd_key'").fetchone()
+        return row[0] if row else None
+
+    def upsert_many(self, rows):
+        """
+        Writes stage results for many candidates in one transaction. Each row is a dict with
+        'candidate_id' and any of RESULT_COLUMNS; columns a row does not mention keep their value.
+        Rankings use updated_score once the feedback stage has set it, grade_score before that.
+        """
+        cursor = self.conn.cursor()
+        now = time.time()
+        for row in rows:
+            columns = [col for col in RESULT_COLUMNS if col in row]
+            values = [to_sql_value(col, row[col]) for col in columns]
+            assignments = "".join(f", {col} = excluded.{col}" for col in columns)
+            cursor.execute(f'''
+                INSERT INTO LiveResults (candidate_id, updated_at{"".join(", " + c for c in columns)})
+                VALUES (?, ?{", ?" * len(columns)})
+                ON CONFLICT(candidate_id) DO UPDATE SET updated_at = excluded.updated_at{assignments}
+            ''', [row["candidate_id"], now] + values)
+            cursor.execute(
+                "UPDATE LiveResults SET rank_score = COALESCE(updated_score, grade_score) WHERE candidate_id = ?",
+                (row["candidate_id"],)
+            )
+        self.conn.commit()
+
+    def upsert(self, candidate_id, **columns):
+        self.upsert_many([dict(columns, candidate_id=candidate_id)])
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM LiveResults").fetchone()[0]
+
+    def retain(self, candidate_ids):
+        """Drops every candidate not in candidate_ids, e.g. those a cascade prescreen screened out."""
+        cursor = self.conn.cursor()
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS RetainIds (candidate_id TEXT PRIMARY KEY)")
+        cursor.execute("DELETE FROM RetainIds")
+        cursor.executemany("INSERT OR IGNORE INTO RetainIds VALUES (?)", [(cid,) for cid in candidate_ids])
+        cursor.execute("DELETE FROM LiveResults WHERE candidate_id NOT IN (SELECT candidate_id FROM RetainIds)")
+        self.conn.commit()
+
+    def candidate_ids(self):
+        return [row[0] for row in self.conn.execute("SELECT candidate_id FROM LiveResults")]
+
+    def components(self, candidate_ids, columns):
+        """Looks up the given score columns for a set of candidates by primary key."""
+        columns = [col for col in columns if col in RESULT_COLUMNS]
+        placeholders = ",".join("?" * len(candidate_ids))
+        rows = self.conn.execute(
+            f"SELECT candidate_id, {', '.join(columns)} FROM LiveResults WHERE candidate_id IN ({placeholders})",
+            list(candidate_ids)
+        )
+        return {row[0]: dict(zip(columns, row[1:])) for row in rows}
+
+    def progress(self):
+        """Number of candidates each stage has filled in so far."""
+        row = self.conn.execute(
+            "SELECT COUNT(*), " + ", ".join(f"COUNT({col})" for col in RESULT_COLUMNS) + " FROM LiveResults"
+        ).fetchone()
+        return dict(zip(["candidates"] + RESULT_COLUMNS, row))
+
+    def page(self, offset=0, limit=10):
+        """Returns one page of candidates ranked by rank_score, using the rank index."""
+        query = '''
+            SELECT candidate_id, rank_score, grade_score, persona_fit_score, cv_bias_flags, bias_free_score,
+                   explanation, updated_score
+            FROM LiveResults
+            ORDER BY rank_score DESC
+            LIMIT ? OFFSET ?
+        '''
+        return pd.read_sql_query(query, self.conn, params=(int(limit), int(offset)))
+
+    def close(self):
+        self.conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live Results Store")
+    parser.add_argument("--db_path", type=str, default="memory.db",
+                        help="Path to SQLite DB (default: memory.db)")
+    parser.add_argument("--top_n", type=int, default=10,
+                        help="Number of top candidates to print (default: 10)")
+    args = parser.parse_args()
+
+    store = ResultsStore(args.db_path)
+    print(store.progress())
+    print(store.page(limit=args.top_n).to_string(index=False))
+    store.close()
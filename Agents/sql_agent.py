@@ -18,10 +18,14 @@ class SQLiteMemoryAgent:
                 candidate_id TEXT PRIMARY KEY,
                 candidate_name TEXT,
                 grade_score REAL,
+                embedding_score REAL,
+                keyword_score REAL,
                 extracted_entities TEXT,
                 cv_text_preview TEXT,
                 cv_bias_flags TEXT,
                 cv_anonymized TEXT,
+                bias_penalty REAL,
+                bias_free_score REAL,
                 persona_fit_score REAL,
                 explanation TEXT,
                 composite_score REAL,
@@ -34,11 +38,16 @@ class SQLiteMemoryAgent:
 
     def insert_candidates(self, csv_path):
         df = pd.read_csv(csv_path, encoding="utf-8")
+        self.insert_dataframe(df)
+        print(f"Inserted candidate data from {csv_path} into Candidates table.")
+
+    def insert_dataframe(self, df):
         # Rename candidate_filename column to candidate_id if necessary.
-        if "candidate_filename" in df.columns:
-            df.rename(columns={"candidate_filename": "candidate_id"}, inplace=True)
+        df = df.rename(columns={"candidate_filename": "candidate_id"})
+        # Keep only columns the Candidates schema knows about.
+        known = [row[1] for row in self.conn.execute("PRAGMA table_info(Candidates)")]
+        df = df[[col for col in df.columns if col in known]]
         df.to_sql("Candidates", self.conn, if_exists="append", index=False)
-        print(f"Inserted candidate data from {csv_path} into Candidates table.")
 
     def query_selected_candidates(self, score_threshold=0.65):
         query = f"SELECT * FROM Candidates WHERE updated_score >= {score_threshold}"
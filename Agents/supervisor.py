@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
 import os
+import time
+import sqlite3
 import subprocess
 import argparse
 import pandas as pd
 import sys
+from results_store import ResultsStore, jd_key
+from feedback_agent import FeedbackLog, SCORE_COMPONENTS, bias_free_scores
+from sql_agent import SQLiteMemoryAgent
+from candidate_store import load_store
 
 def run_agent(script, args_list=[]):
     """
@@ -21,58 +27,207 @@ def run_agent(script, args_list=[]):
         print(f"\n❌ Error while running {script}:\n--- STDOUT ---\n{e.stdout}\n--- STDERR ---\n{e.stderr}")
         raise
 
-def generate_final_csv():
+# The candidate store the CV stages exchange, and the report each stage writes alongside it.
+CANDIDATE_STORE = "candidate_store.npz"
+STAGE_REPORTS = ["cv_bias_fairness.csv", "persona_fit_results.csv",
+                 "explainability_results.csv", "feedback_adjusted_results.csv"]
+# Cascade mode: the grader's top-M CVs, the only ones the expensive stages see.
+SHORTLIST_STORE = "cv_shortlist.npz"
+# Prefix for the stage outputs of the full-pool run made by --recall_check.
+RECALL_PREFIX = "recall_"
+SCORE_COLUMNS = ["grade_score", "embedding_score", "keyword_score", "persona_fit_score", "bias_free_score",
+                 "composite_score", "feedback_adjustment", "updated_score"]
+
+def generate_final_csv(store_path=CANDIDATE_STORE, output_csv="final_selected_candidates.csv", threshold=0.3,
+                       results_db="memory.db", persist=True):
     """
-    Aggregates all agent outputs and generates final_selected_candidates.csv.
+    Aggregates the candidate store every stage has written into the ranked
+    final_selected_candidates.csv. Every score component is computed column-wise. Candidates
+    below the threshold are dropped, and the result is written once to the CSV and, if persist,
+    to the Candidates table. Entities stay out of the ranking and are exported from the store
+    for the selected candidates only.
     """
     try:
-        scores_df = pd.read_csv("cv_grading_results.csv")
-        persona_df = pd.read_csv("persona_fit_results.csv")
-        bias_df = pd.read_csv("cv_bias_fairness.csv")
-        explain_df = pd.read_csv("explainability_results.csv")
+        candidates = load_store(store_path)
+        merged = candidates.to_dataframe()
+        if merged.empty:
+            raise ValueError(f"No candidates found in {store_path} to aggregate.")
 
-        merged = scores_df.copy()
+        for col in SCORE_COLUMNS:
+            merged[col] = merged[col].astype(float)
+        merged["persona_fit_score"] = merged["persona_fit_score"].fillna(0.0)
+        merged["feedback_adjustment"] = merged["feedback_adjustment"].fillna(0.0)
 
-        # Ensure merge safety even if columns are missing
-        merged["persona_fit_score"] = persona_df.get("Persona_Score", [0]*len(merged))
-        merged["cv_bias_flags"] = bias_df.get("Bias_Flags", ["[]"]*len(merged))
-        merged["explanation"] = explain_df.get("Explanation", ["No explanation provided"]*len(merged))
+        # The bias agent stores bias_free_score; derive it from the flags for candidates it did not score.
+        missing = merged["bias_free_score"].isna()
+        merged.loc[missing, "bias_free_score"] = bias_free_scores(merged.loc[missing, "cv_bias_flags"])
+        merged["cv_bias_flags"] = merged["cv_bias_flags"].fillna("[]")
+        merged["bias_penalty"] = 1.0 - merged["bias_free_score"]
 
-        # Compute final score
-        merged["updated_score"] = (
-            0.4 * merged["CV_Score"] +
-            0.3 * merged["persona_fit_score"] +
-            0.3 * (1 - merged["cv_bias_flags"].apply(lambda x: len(eval(x)) if isinstance(x, str) else 0) / 10)
-        )
+        # Candidates the feedback stage did not score fall back to the current composite weights.
+        log = FeedbackLog(results_db)
+        weights = log.weights()
+        log.close()
+        fallback = sum(weights[c] * merged[c].fillna(0.0) for c in SCORE_COMPONENTS)
+        merged["composite_score"] = merged["composite_score"].fillna(fallback)
+        merged["updated_score"] = merged["updated_score"].fillna(merged["composite_score"] + merged["feedback_adjustment"])
 
-        merged.rename(columns={
-            "Candidate": "candidate_filename",
-            "CV_Score": "grade_score"
-        }, inplace=True)
+        final = merged[merged["updated_score"] >= threshold].sort_values("updated_score", ascending=False)
+        # The frame's index is still the store's row order, which is what entities_json takes.
+        final.insert(final.columns.get_loc("explanation") + 1, "extracted_entities", candidates.entities_json(final.index))
+        final = final.reset_index(drop=True)
+        final.to_csv(output_csv, index=False, encoding="utf-8")
+        print(f"✅ Final result saved to: {output_csv} ({len(final)} of {len(merged)} candidates above {threshold})")
 
-        merged.to_csv("final_selected_candidates.csv", index=False)
-        print("✅ Final result saved to: final_selected_candidates.csv")
+        if persist:
+            agent = SQLiteMemoryAgent(db_path=results_db)
+            agent.insert_dataframe(final)
+            agent.close()
 
     except Exception as e:
         print(f"❌ Failed to generate final CSV: {e}")
         raise
 
+def run_jd_optimizer(jd_csv):
+    run_agent("jd_optimizer.py", ["--jd_csv", jd_csv, "--output_csv", "optimized_jds.csv"])
+
+def run_grader(cv_folder, results_db, index_db, prefix="", dedup_db=None, prescreen_shortlist=None):
+    """
+    Grades the CV folder into the candidate store, passing every path explicitly; the store
+    and the report get prefix prepended. With prescreen_shortlist, the grader prescreens the
+    pool without NER and also saves its top CVs to the shortlist store.
+    """
+    grader_args = ["--jd_csv", "optimized_jds.csv", "--cv_folder", cv_folder,
+                   "--output_csv", prefix + "cv_grading_results.csv", "--store_path", prefix + CANDIDATE_STORE,
+                   "--results_db", results_db, "--index_db", index_db]
+    if dedup_db is not None:
+        grader_args += ["--dedup_db", dedup_db]
+    if prescreen_shortlist is not None:
+        grader_args += ["--prescreen", "--shortlist", str(prescreen_shortlist), "--shortlist_path", SHORTLIST_STORE]
+    run_agent("cv_grader.py", grader_args)
+
+def run_downstream_stages(store_path, results_db, prefix=""):
+    """
+    Runs the bias, persona, explainability and feedback agents over the candidates in
+    store_path, which each of them updates in place, passing every path explicitly. Their
+    reports are the usual stage CSVs with prefix prepended.
+    """
+    bias_csv, persona_csv = (prefix + path for path in STAGE_REPORTS[:2])
+    run_agent("bias_agent.py", ["--jd_input", "optimized_jds.csv", "--jd_output", prefix + "jd_bias_fairness.csv",
+                                "--store_path", store_path, "--cv_output", bias_csv, "--results_db", results_db])
+    run_agent("persona_agent.py", ["--store_path", store_path, "--output_csv", persona_csv,
+                                   "--results_db", results_db])
+    run_ranking_stages(store_path, results_db, prefix)
+
+def run_ranking_stages(store_path, results_db, prefix=""):
+    """Runs the explainability and feedback agents over store_path, the last stages before aggregation."""
+    explain_csv, feedback_csv = (prefix + path for path in STAGE_REPORTS[2:])
+    run_agent("explainability_agent.py", ["--store_path", store_path, "--output_csv", explain_csv,
+                                          "--results_db", results_db])
+    run_agent("feedback_agent.py", ["--store_path", store_path, "--output_csv", feedback_csv,
+                                    "--results_db", results_db])
+
+def snapshot_db(src_path, dst_path):
+    """Copies a SQLite DB, including pages still in its WAL, so a side run leaves the original untouched."""
+    src = sqlite3.connect(src_path, timeout=30)
+    dst = sqlite3.connect(dst_path)
+    src.backup(dst)
+    dst.close()
+    src.close()
+
+def cascade_recall(cascade_csv, full_csv, k):
+    """
+    Compares the cascade's ranking with a full run's: recall@k is the share of the full run's
+    top k that the cascade also ranks in its top k, and selection recall the share of the full
+    run's above-threshold candidates that the cascade also selects.
+    """
+    cascade = pd.read_csv(cascade_csv, encoding="utf-8")["candidate_filename"]
+    full = pd.read_csv(full_csv, encoding="utf-8")["candidate_filename"]
+    full_top = set(full.head(k))
+    top_recall = len(full_top & set(cascade.head(k))) / len(full_top) if full_top else 1.0
+    selection_recall = len(set(full) & set(cascade)) / len(full) if len(full) else 1.0
+    return {"recall_at_k": top_recall, "selection_recall": selection_recall}
+
+def run_recall_check(args, cascade_seconds):
+    """
+    Runs the whole pipeline without the cascade, grading with NER and then running every
+    expensive stage on every CV, and reports how much of that ranking the cascade kept and
+    how long each took. The full run writes recall_-prefixed outputs and uses a copy of the
+    results DB, so the live results and learned weights are untouched. Its dedup DB starts
+    empty, so no CV reuses entities or embeddings cached by earlier runs and every CV really
+    goes through NER.
+    """
+    print("\n🔍 Recall check: running the full pipeline over the whole pool...")
+    scratch_db = RECALL_PREFIX + os.path.basename(args.results_db)
+    snapshot_db(args.results_db, scratch_db)
+    store = ResultsStore(scratch_db)
+    store.reset(jd_key(args.jd_csv, args.jd_index))
+    store.close()
+    dedup_db = RECALL_PREFIX + "dedup.db"
+    if os.path.exists(dedup_db):
+        os.remove(dedup_db)
+    store_path = RECALL_PREFIX + CANDIDATE_STORE
+    start = time.perf_counter()
+    run_grader(args.cv_folder, scratch_db, args.index_db, prefix=RECALL_PREFIX, dedup_db=dedup_db)
+    run_downstream_stages(store_path, scratch_db, prefix=RECALL_PREFIX)
+    full_seconds = time.perf_counter() - start
+
+    full_csv = RECALL_PREFIX + os.path.basename(args.final_selected)
+    generate_final_csv(store_path, full_csv, threshold=args.threshold, results_db=scratch_db, persist=False)
+
+    report = cascade_recall(args.final_selected, full_csv, args.recall_k)
+    pool_size = len(load_store(store_path))
+    print(f"📈 Cascade recall@{args.recall_k}: {report['recall_at_k']:.1%} | "
+          f"selection recall: {report['selection_recall']:.1%}")
+    print(f"⏱️ Grading and CV stages: {cascade_seconds:.1f}s with the cascade "
+          f"({min(args.shortlist, pool_size)} of {pool_size} CVs shortlisted) vs {full_seconds:.1f}s for the full run")
+    if args.shortlist < args.recall_k:
+        print(f"⚠️ --shortlist {args.shortlist} is below --recall_k {args.recall_k}; recall@k cannot reach 100%.")
+    return report
+
 def main(args):
-    agents = [
-        "jd_optimizer.py",
-        "cv_grader.py",
-        "bias_agent.py",
-        "persona_agent.py",
-        "explainability_agent.py",
-        "feedback_agent.py",  # Optional - can be skipped if not implemented
-        "sql_agent.py"
-    ]
-
-    for script in agents:
-        run_agent(script)
+    # Start from an empty live results table so the dashboard only shows this run, and key
+    # recruiter feedback given on it to this JD.
+    store = ResultsStore(args.results_db)
+    store.reset(jd_key(args.jd_csv, args.jd_index))
+    store.close()
+
+    store_path = CANDIDATE_STORE
+    cascade_seconds = None
+    if args.cascade:
+        # Cascade mode: a cheap prescreen (embedding + BM25, no NER) over the whole pool, then the
+        # expensive stages on the top --shortlist CVs only.
+        run_jd_optimizer(args.jd_csv)
+        start = time.perf_counter()
+        run_grader(args.cv_folder, args.results_db, args.index_db, prescreen_shortlist=args.shortlist)
+        run_downstream_stages(SHORTLIST_STORE, args.results_db)
+        cascade_seconds = time.perf_counter() - start
+        store_path = SHORTLIST_STORE
+    elif args.queue_db:
+        # Scale-out mode: grading, bias and persona already ran on job_queue.py workers.
+        run_agent("job_queue.py", ["collect", "--queue_db", args.queue_db, "--jd_index", str(args.jd_index),
+                                   "--jd_csv", "optimized_jds.csv", "--index_db", args.index_db,
+                                   "--results_db", args.results_db,
+                                   "--output_csv", "cv_grading_results.csv", "--store_path", CANDIDATE_STORE]
+                  + (["--allow_failed"] if args.allow_failed else []))
+        run_ranking_stages(CANDIDATE_STORE, args.results_db)
+    elif args.workers:
+        # Pre-forked mode: one process loads every model, then forks workers that share the weights.
+        run_agent("worker_pool.py", [
+            "--raw_jd_csv", args.jd_csv, "--jd_csv", "optimized_jds.csv", "--cv_folder", args.cv_folder,
+            "--jd_index", str(args.jd_index), "--workers", str(args.workers), "--index_db", args.index_db,
+            "--output_csv", "cv_grading_results.csv", "--store_path", CANDIDATE_STORE, "--results_db", args.results_db
+        ])
+        run_ranking_stages(CANDIDATE_STORE, args.results_db)
+    else:
+        run_jd_optimizer(args.jd_csv)
+        run_grader(args.cv_folder, args.results_db, args.index_db)
+        run_downstream_stages(CANDIDATE_STORE, args.results_db)
 
     print("\n📊 Aggregating outputs into final CSV...")
-    generate_final_csv()
+    generate_final_csv(store_path, args.final_selected, threshold=args.threshold, results_db=args.results_db)
+    if args.recall_check:
+        run_recall_check(args, cascade_seconds)
 
     # Print a quick preview of top candidates
     if os.path.exists(args.final_selected):
@@ -86,5 +241,33 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="HireSense | Supervisor Agent for Full Pipeline")
     parser.add_argument("--final_selected", type=str, default="final_selected_candidates.csv",
                         help="Output CSV file with ranked candidates")
+    parser.add_argument("--threshold", type=float, default=0.3,
+                        help="Minimum updated_score for a candidate to be selected (default: 0.3)")
+    parser.add_argument("--queue_db", type=str, default=None,
+                        help="Collect CV stage results from this job_queue.py queue instead of running them here")
+    parser.add_argument("--jd_index", type=int, default=0,
+                        help="JD row whose queue or worker pool results to use (default: 0)")
+    parser.add_argument("--allow_failed", action="store_true",
+                        help="With --queue_db, rank without the CVs of queue units that failed instead of stopping")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Run the CV stages in this many pre-forked workers sharing one copy of the models (default: off)")
+    parser.add_argument("--jd_csv", type=str, default="Dataset/job_description.csv",
+                        help="Raw JD CSV to optimize and score against (default: Dataset/job_description.csv)")
+    parser.add_argument("--cv_folder", type=str, default="Dataset/CVs1",
+                        help="CV folder to grade (default: Dataset/CVs1)")
+    parser.add_argument("--results_db", type=str, default="memory.db",
+                        help="SQLite DB holding the live results read by the dashboard (default: memory.db)")
+    parser.add_argument("--index_db", type=str, default="cv_index.db",
+                        help="BM25 keyword index the grader updates and scores against (default: cv_index.db)")
+    parser.add_argument("--cascade", action="store_true",
+                        help="Prescreen every CV cheaply, then run the expensive stages on the shortlist only")
+    parser.add_argument("--shortlist", type=int, default=200,
+                        help="CVs kept after the cascade prescreen (default: 200)")
+    parser.add_argument("--recall_check", action="store_true",
+                        help="With --cascade, also run the full pipeline without the cascade and report the cascade's recall")
+    parser.add_argument("--recall_k", type=int, default=50,
+                        help="Top-k compared by --recall_check (default: 50, the dashboard's largest page)")
     args = parser.parse_args()
+    if args.recall_check and not args.cascade:
+        parser.error("--recall_check requires --cascade")
     main(args)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+import os
+import gc
+import sys
+import argparse
+import multiprocessing
+import pandas as pd
+from job_queue import RESULT_COLUMNS, process_unit, score_keywords, write_stage_outputs
+from candidate_store import CandidateStore
+
+# Models loaded by the parent before forking; children inherit them copy-on-write.
+_models = None
+
+def freeze_for_inference(module):
+    """
+    Puts a torch module in eval mode with gradients off and moves its weights to shared memory,
+    so forked workers read the parent's pages instead of copying them.
+    """
+    module.eval()
+    module.requires_grad_(False)
+    module.share_memory()
+    return module
+
+def load_models(index_db="cv_index.db", dedup_db="memory.db", results_db="memory.db", with_jd_optimizer=False):
+    """
+    Loads every model the CV stages need, once: the grader's spaCy pipeline and embedder, the
+    bias agent (reusing the grader's spaCy pipeline), the persona sentiment pipeline and,
+    optionally, the T5 JD rephraser. Autotuning runs here too so children don't repeat it.
+    """
+    import torch
+    from cv_grader import CVParserGrader
+    from bias_agent import BiasFairnessMonitorAgent
+    import persona_agent
+
+    grader = CVParserGrader(index_db=index_db, results_db=results_db, dedup_db=dedup_db)
+    models = {
+        "grader": grader,
+        "bias_agent": BiasFairnessMonitorAgent(nlp=grader.nlp),
+        "jd_optimizer": None,
+    }
+    persona_agent.get_batcher()
+    modules = [grader.embedder, persona_agent.sentiment_pipeline.model]
+    if with_jd_optimizer:
+        from jd_optimizer import JDExtractorOptimizer
+        models["jd_optimizer"] = JDExtractorOptimizer(nlp=grader.nlp)
+        modules.append(models["jd_optimizer"].rephraser.model)
+    for module in modules:
+        freeze_for_inference(module)
+    torch.set_grad_enabled(False)
+    return models
+
+def prepare_fork():
+    """
+    Gets the parent ready to fork workers that share its models: disables the tokenizers'
+    thread pool (not fork-safe) and moves everything allocated so far out of the garbage
+    collector's reach, so collections in the children don't touch, and so copy, the shared pages.
+    Returns a fork multiprocessing context.
+    """
+    if sys.platform == "win32":
+        raise RuntimeError("Pre-forked workers need the 'fork' start method, which Windows does not provide.")
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    gc.collect()
+    gc.freeze()
+    return multiprocessing.get_context("fork")
+
+def init_worker(threads):
+    """Pool initializer: splits the host's cores between the workers."""
+    import torch
+    torch.set_num_threads(threads)
+
+def score_chunk(payload):
+    """
+    Runs one chunk of CVs through the shared models in a forked worker. The chunk is only
+    added to the keyword index; the parent BM25-scores the whole pool once all chunks are in.
+    """
+    return process_unit(_models["grader"], _models["bias_agent"], payload, score_keywords=False)
+
+def chunk_payloads(jd_csv, cv_folder, jd_index=0, chunk_size=50):
+    cv_paths = sorted(os.path.abspath(os.path.join(cv_folder, f)) for f in os.listdir(cv_folder)
+                      if f.lower().endswith((".pdf", ".txt")))
+    return [
+        {"jd_csv": jd_csv, "jd_index": jd_index, "cv_paths": cv_paths[i:i + chunk_size]}
+        for i in range(0, len(cv_paths), chunk_size)
+    ]
+
+def run_pool(jd_csv, cv_folder, output_csv, store_path, jd_index=0, workers=None, chunk_size=50,
+             index_db="cv_index.db", dedup_db="memory.db", results_db="memory.db",
+             raw_jd_csv=None, embedding_weight=0.7, keyword_weight=0.3):
+    """
+    Scores a CV folder against one JD with pre-forked workers that share one copy of the models.
+    If raw_jd_csv is given, the JDs are optimized first in the parent and written to jd_csv.
+    The workers index their chunks, then the parent BM25-scores the whole pool once. Saves the
+    candidate store and the grading report, and returns the store.
+    """
+    global _models
+    workers = workers or os.cpu_count() or 1
+    _models = load_models(index_db=index_db, dedup_db=dedup_db, results_db=results_db,
+                          with_jd_optimizer=raw_jd_csv is not None)
+    if raw_jd_csv is not None:
+        _models["jd_optimizer"].process_jd_file(raw_jd_csv, jd_csv)
+
+    payloads = chunk_payloads(jd_csv, cv_folder, jd_index=jd_index, chunk_size=chunk_size)
+    if not payloads:
+        print(f"No CV files found in {cv_folder}.")
+        return None
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"DEBUG: Forking {workers} workers ({threads} torch threads each) for {len(payloads)} chunks...")
+    ctx = prepare_fork()
+    rows = []
+    with ctx.Pool(workers, initializer=init_worker, initargs=(threads,)) as pool:
+        for chunk_rows in pool.imap_unordered(score_chunk, payloads):
+            rows.extend(chunk_rows)
+            print(f"DEBUG: {len(rows)} CVs scored.")
+    gc.unfreeze()
+
+    candidates = CandidateStore.from_dataframe(pd.DataFrame(rows, columns=["jd_index"] + RESULT_COLUMNS))
+    score_keywords(candidates, index_db, jd_csv, jd_index)
+    write_stage_outputs(candidates, output_csv, store_path, results_db=results_db,
+                        embedding_weight=embedding_weight, keyword_weight=keyword_weight)
+    return candidates
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-forked CV Scoring Workers")
+    parser.add_argument("--jd_csv", type=str, required=True,
+                        help="Optimized JD CSV (written first when --raw_jd_csv is given)")
+    parser.add_argument("--cv_folder", type=str, required=True, help="Folder of CV files (PDF or TXT)")
+    parser.add_argument("--raw_jd_csv", type=str, default=None,
+                        help="Raw JD CSV to optimize in the parent before scoring (optional)")
+    parser.add_argument("--jd_index", type=int, default=0, help="Row of the JD CSV to score against (default: 0)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument("--chunk_size", type=int, default=50, help="CVs per dispatched chunk (default: 50)")
+    parser.add_argument("--output_csv", type=str, default="cv_grading_results.csv",
+                        help="Grading report (default: cv_grading_results.csv)")
+    parser.add_argument("--store_path", type=str, default="candidate_store.npz",
+                        help="Candidate store the later stages read (default: candidate_store.npz)")
+    parser.add_argument("--index_db", type=str, default="cv_index.db", help="BM25 keyword index DB (default: cv_index.db)")
+    parser.add_argument("--dedup_db", type=str, default="memory.db", help="Dedup index DB (default: memory.db)")
+    parser.add_argument("--results_db", type=str, default="memory.db", help="Live results DB (default: memory.db)")
+    args = parser.parse_args()
+
+    run_pool(args.jd_csv, args.cv_folder, args.output_csv, args.store_path, jd_index=args.jd_index, workers=args.workers,
+             chunk_size=args.chunk_size, index_db=args.index_db, dedup_db=args.dedup_db,
+             results_db=args.results_db, raw_jd_csv=args.raw_jd_csv)
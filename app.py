@@ -6,6 +6,15 @@ import shutil
 import tempfile
 import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Agents'))
+from results_store import ResultsStore
+from feedback_agent import FeedbackLog
+
+# How often the dashboard re-reads the live results while the pipeline runs.
+POLL_INTERVAL_SECONDS = 1.0
 
 class HireSenseDashboard:
     def __init__(self):
@@ -25,21 +34,29 @@ class HireSenseDashboard:
                 'Job Description': [job_description]
             }).to_csv(os.path.join(dataset_dir, 'job_description.csv'), index=False)
 
-            # Save uploaded CVs
-            for uploaded_file in uploaded_files:
-                file_path = os.path.join(cv_dir, uploaded_file.name)
-                with open(file_path, 'wb') as f:
-                    f.write(uploaded_file.getbuffer())
+            # Save uploaded CVs, streaming each file to disk in parallel
+            def save_upload(uploaded_file):
+                uploaded_file.seek(0)
+                with open(os.path.join(cv_dir, uploaded_file.name), 'wb') as f:
+                    shutil.copyfileobj(uploaded_file, f)
+
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                list(pool.map(save_upload, uploaded_files))
 
             # Copy agent scripts to temp directory
             agents = [
                 "jd_optimizer.py",
                 "cv_grader.py",
+                "keyword_index.py",
+                "dedup.py",
+                "candidate_store.py",
+                "autotune.py",
                 "bias_agent.py",
                 "persona_agent.py",
                 "explainability_agent.py",
-                "feedback_agent.py",  # Optional
+                "feedback_agent.py",
                 "sql_agent.py",
+                "results_store.py",
                 "supervisor.py"
             ]
 
@@ -60,60 +77,150 @@ class HireSenseDashboard:
             st.error(f"❌ Workspace setup failed: {str(e)}")
             raise
 
-    def process_candidates(self, job_title, job_description, uploaded_files, top_n):
+    def stream_pipeline(self, temp_dir, top_n, placeholder, shortlist=None):
+        """
+        Runs the supervisor in the background and re-renders the current top candidates
+        from the live results store until it exits. Returns (returncode, log text).
+        """
+        env = os.environ.copy()
+        env["TRANSFORMERS_NO_TF"] = "1"
+        log_path = os.path.join(temp_dir, 'pipeline.log')
+        results_db = os.path.join(temp_dir, 'memory.db')
+
+        command = [sys.executable, "supervisor.py", "--results_db", results_db]
+        if shortlist:
+            # Cascade: only the prescreen's top CVs go through the expensive stages.
+            command += ["--cascade", "--shortlist", str(shortlist)]
+
+        with open(log_path, 'w') as log:
+            # Run supervisor using current Python interpreter
+            process = subprocess.Popen(
+                command,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                text=True,
+                env=env
+            )
+            while process.poll() is None:
+                time.sleep(POLL_INTERVAL_SECONDS)
+                if os.path.exists(results_db):
+                    store = ResultsStore(results_db)
+                    with placeholder.container():
+                        render_progress(store.progress())
+                        render_candidates(store.page(limit=top_n))
+                    store.close()
+
+        with open(log_path) as log:
+            return process.returncode, log.read()
+
+    def process_candidates(self, job_title, job_description, uploaded_files, top_n, placeholder, shortlist=None):
+        """
+        Runs the pipeline, streaming partial rankings into the placeholder. Returns the path
+        of the persisted results DB, which the dashboard pages through afterwards.
+        """
         with tempfile.TemporaryDirectory() as temp_dir:
             original_dir = os.getcwd()
             try:
                 self.setup_workspace(temp_dir, job_title, job_description, uploaded_files)
                 os.chdir(temp_dir)
 
-                env = os.environ.copy()
-                env["TRANSFORMERS_NO_TF"] = "1"
-
-                # Run supervisor using current Python interpreter
-                result = subprocess.run(
-                    [sys.executable, "supervisor.py"],
-                    check=True,
-                    capture_output=True,
-                    text=True,
-                    env=env
-                )
+                returncode, output = self.stream_pipeline(temp_dir, top_n, placeholder, shortlist)
+                if returncode != 0:
+                    st.error("❌ Pipeline execution failed.")
+                    st.text("OUTPUT:\n" + output)
+                    raise subprocess.CalledProcessError(returncode, "supervisor.py", output)
                 st.success("✅ Pipeline executed successfully.")
-                st.code(result.stdout)
+                st.code(output)
 
                 results_path = os.path.join(temp_dir, 'final_selected_candidates.csv')
                 if os.path.exists(results_path):
-                    final_results = pd.read_csv(results_path)
-
-                    top_candidates = final_results.nlargest(top_n, 'updated_score')
-                    results = []
-                    for _, row in top_candidates.iterrows():
-                        results.append({
-                            'candidate': row.get('candidate_id', row.get('candidate_filename')),
-                            'match_score': row['updated_score'] * 100,
-                            'cv_score': row['grade_score'] * 100,
-                            'persona_score': row['persona_fit_score'] * 100,
-                            'bias_free_score': (1 - len(eval(row['cv_bias_flags'])) / 10) * 100 if isinstance(row['cv_bias_flags'], str) else 100,
-                            'explanation': row['explanation']
-                        })
-
                     # Copy back for persistence
                     shutil.copy2(results_path, os.path.join(self.agents_dir, 'final_selected_candidates.csv'))
+                    for db_file in ('memory.db', 'cv_index.db'):
+                        if os.path.exists(os.path.join(temp_dir, db_file)):
+                            shutil.copy2(os.path.join(temp_dir, db_file), os.path.join(self.agents_dir, db_file))
                     os.chdir(original_dir)
-                    return results
+                    return os.path.join(self.agents_dir, 'memory.db')
                 else:
                     raise FileNotFoundError("Results CSV not found after pipeline execution.")
 
-            except subprocess.CalledProcessError as e:
-                st.error("❌ Pipeline execution failed.")
-                st.text("STDOUT:\n" + e.stdout)
-                st.text("STDERR:\n" + e.stderr)
-                os.chdir(original_dir)
-                raise
             except Exception as e:
                 os.chdir(original_dir)
                 raise
 
+def render_progress(progress):
+    """Shows how far each stage has got through the candidate pool."""
+    total = progress["candidates"]
+    st.markdown(
+        f"**Scored:** {total} · **Bias-checked:** {progress['cv_bias_flags']}/{total} · "
+        f"**Persona:** {progress['persona_fit_score']}/{total} · "
+        f"**Explained:** {progress['explanation']}/{total} · **Final:** {progress['updated_score']}/{total}"
+    )
+
+def record_feedback(results_db, candidate_id, event_type):
+    """
+    Button callback: logs the event, which rescores only this candidate before the page reruns.
+    Once enough events are waiting, the weights are re-learned (and every candidate rescored)
+    by a background feedback_agent.py process, so the click never waits on it.
+    """
+    log = FeedbackLog(results_db)
+    log.record_event(candidate_id, event_type)
+    if log.weights_due():
+        agents_dir = HireSenseDashboard().agents_dir
+        subprocess.Popen([sys.executable, os.path.join(agents_dir, "feedback_agent.py"), "--update_weights",
+                          "--results_db", results_db], cwd=agents_dir,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    log.close()
+
+def render_candidates(page_df, start_rank=1, feedback_db=None):
+    """
+    Renders one page of ranked candidates; columns later stages have not filled in yet show
+    as pending. With feedback_db set, each candidate gets thumbs up/down buttons.
+    """
+    for i, row in enumerate(page_df.itertuples(index=False), start_rank):
+        match = f"{row.rank_score * 100:.2f}%" if pd.notna(row.rank_score) else "⏳ pending"
+        with st.expander(f"#{i} – {row.candidate_id} (Match Score: {match})"):
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown("**📊 Score Breakdown**")
+                if pd.notna(row.grade_score):
+                    st.write(f"CV Match Score: {row.grade_score * 100:.2f}%")
+                else:
+                    st.write("CV Match Score: ⏳ pending")
+                if pd.notna(row.persona_fit_score):
+                    st.write(f"Persona Fit Score: {row.persona_fit_score * 100:.2f}%")
+                else:
+                    st.write("Persona Fit Score: ⏳ pending")
+                if pd.notna(row.bias_free_score):
+                    st.write(f"Bias-Free Score: {row.bias_free_score * 100:.2f}%")
+                else:
+                    st.write("Bias-Free Score: ⏳ pending")
+            with col2:
+                st.markdown("**💡 Explanation**")
+                st.write(row.explanation if isinstance(row.explanation, str) else "⏳ pending")
+            if feedback_db:
+                up, down = st.columns(2)
+                up.button("👍 Good fit", key=f"up_{row.candidate_id}", on_click=record_feedback,
+                          args=(feedback_db, row.candidate_id, "thumbs_up"))
+                down.button("👎 Poor fit", key=f"down_{row.candidate_id}", on_click=record_feedback,
+                            args=(feedback_db, row.candidate_id, "thumbs_down"))
+
+def render_results_page(results_db, page_size):
+    """Server-side pagination: only the requested page is read from the results store."""
+    store = ResultsStore(results_db)
+    total = store.count()
+    if total == 0:
+        store.close()
+        st.warning("⚠️ No candidates returned from pipeline.")
+        return
+
+    st.header("🏆 Top Candidates")
+    n_pages = (total + page_size - 1) // page_size
+    page = st.number_input(f"Page (1–{n_pages})", min_value=1, max_value=n_pages, value=1, step=1)
+    offset = (page - 1) * page_size
+    render_candidates(store.page(offset=offset, limit=page_size), start_rank=offset + 1, feedback_db=results_db)
+    store.close()
+
 def main():
     st.set_page_config(
         page_title="HireSense Dashboard",
@@ -132,42 +239,38 @@ def main():
     uploaded_files = st.file_uploader("Upload candidate CVs (PDF only)", type=['pdf'], accept_multiple_files=True)
 
     st.header("🎛️ Configuration")
-    top_n = st.slider("Number of top candidates to display", 1, 50, 10)
+    top_n = st.slider("Candidates per page", 1, 50, 10)
+    cascade = st.checkbox("Cascade ranking (run the expensive stages on a shortlist only)")
+    shortlist = st.number_input("Shortlist size", min_value=1, value=200, step=50) if cascade else None
 
     if st.button("🚀 Run Pipeline"):
         if not job_title or not job_description or not uploaded_files:
             st.warning("⚠️ Please complete all fields before running the pipeline.")
         else:
             dashboard = HireSenseDashboard()
+            live_placeholder = st.empty()
             with st.spinner("🔄 Processing candidates..."):
                 try:
-                    results = dashboard.process_candidates(job_title, job_description, uploaded_files, top_n)
-
-                    if results:
-                        st.header("🏆 Top Candidates")
-                        for i, result in enumerate(results, 1):
-                            with st.expander(f"#{i} – {result['candidate']} (Match Score: {result['match_score']:.2f}%)"):
-                                col1, col2 = st.columns(2)
-                                with col1:
-                                    st.markdown("**📊 Score Breakdown**")
-                                    st.write(f"CV Match Score: {result['cv_score']:.2f}%")
-                                    st.write(f"Persona Fit Score: {result['persona_score']:.2f}%")
-                                    st.write(f"Bias-Free Score: {result['bias_free_score']:.2f}%")
-                                with col2:
-                                    st.markdown("**💡 Explanation**")
-                                    st.write(result['explanation'])
-
-                        st.download_button(
-                            "📥 Download Results as CSV",
-                            pd.DataFrame(results).to_csv(index=False).encode("utf-8"),
-                            "hiresense_results.csv",
-                            "text/csv"
-                        )
-                    else:
-                        st.warning("⚠️ No candidates returned from pipeline.")
-
+                    # Only the DB path is kept in the session; pages are queried on demand.
+                    st.session_state["results_db"] = dashboard.process_candidates(
+                        job_title, job_description, uploaded_files, top_n, live_placeholder, shortlist
+                    )
+                    live_placeholder.empty()
                 except Exception as e:
                     st.error(f"❌ An error occurred: {str(e)}")
 
+    if st.session_state.get("results_db"):
+        render_results_page(st.session_state["results_db"], top_n)
+
+        results_csv = os.path.join(HireSenseDashboard().agents_dir, 'final_selected_candidates.csv')
+        if os.path.exists(results_csv):
+            with open(results_csv, 'rb') as f:
+                st.download_button(
+                    "📥 Download Results as CSV",
+                    f.read(),
+                    "hiresense_results.csv",
+                    "text/csv"
+                )
+
 if __name__ == "__main__":
     main()